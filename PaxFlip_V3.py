@@ -16,29 +16,92 @@ support@intercomserviceslondon.co.uk
 GitHub: https://github.com/ISLKey/PaxFlip
 """
 
+import time
+
+# Taken before anything else is imported, for --startup-profile
+_SCRIPT_START = time.perf_counter()
+
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import pyperclip
-import subprocess
 import os
-import webbrowser
-import re
-from datetime import datetime
 
-try:
-    from PIL import Image, ImageTk
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
+from paxflip_engine import (
+    TokenError,
+    convert_token as engine_convert_token,
+    default_token_name,
+    format_hex_for_flipper,
+    generate_flipper_content,
+    app_data_dir,
+    rfid_filename,
+    TokenRecord,
+)
+from paxflip_exporters import get_exporter
+from paxflip_metrics import metrics
+from paxflip_results import EXPORTED, FAILED, ResultStore, VirtualResultsView
+from paxflip_service import (
+    NOT_FOUND,
+    PENDING,
+    QUERY,
+    RUNNING,
+    START,
+    STOP,
+    STOPPED,
+    ServiceMonitor,
+    create_backend,
+)
+
+# Header logo, and the pre-resized copy cached so later starts skip PIL entirely
+LOGO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'isl_logo.jpg')
+LOGO_SIZE = (80, 80)
+LOGO_CACHE_FILE = os.path.join(app_data_dir(), 'cache', 'isl_logo_80x80.png')
+
+# How often the GUI collects results from the service worker
+SERVICE_POLL_MS = 100
+
+# How often the GUI refreshes batch progress
+BATCH_POLL_MS = 200
+
+class StartupTimer:
+    """Record how long each phase of startup takes, for --startup-profile"""
+    
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.phases = []
+        
+    def mark(self, phase):
+        """Close the current phase under the given name"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+        
+    def report(self):
+        """Format the phase breakdown as text"""
+        lines = ["PaxFlip startup profile (from script start):"]
+        for phase, seconds in self.phases:
+            lines.append(f"  {phase:<20} {seconds * 1000:8.1f} ms")
+        lines.append(f"  {'total':<20} {(self.last - self.start) * 1000:8.1f} ms")
+        return "\n".join(lines)
 
 class PaxFlipClean:
-    def __init__(self, root):
+    def __init__(self, root, service_backend=None, startup_timer=None, metrics_file=None):
         self.root = root
+        self.startup_timer = startup_timer
+        self.metrics_file = metrics_file
+        self.phase_started = time.perf_counter()
+        self.service_worker = ServiceMonitor(service_backend or create_backend())
+        self.displayed_service_state = None
+        self.mark_startup("service_worker")
         self.setup_window()
+        self.mark_startup("setup_window")
         self.setup_colors()
         self.setup_variables()
         self.setup_ui()
+        self.mark_startup("setup_ui")
         self.check_net2_service()
+        self.poll_service_results()
+        self.mark_startup("service_check")
         
         # Bind window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -83,6 +146,23 @@ class PaxFlipClean:
         self.flipper_name_var = tk.StringVar(value="Paxton_Token")
         self.service_status_var = tk.StringVar(value="Checking...")
         
+        # Every token converted or exported this session
+        self.results = ResultStore()
+        self.current_result_index = None
+        self.results_window = None
+        self.results_view = None
+        
+        # Token ledger, opened on first use
+        self.ledger = None
+        self.ledger_unavailable = False
+        
+        # Batch export
+        self.batch_job = None
+        self.batch_counting = False
+        self.batch_duplicates = 0
+        self.batch_status_var = tk.StringVar(value="No batch running")
+        self.batch_archive_var = tk.BooleanVar(value=False)
+        
     def setup_ui(self):
         """Create the user interface"""
         # Create main container with scrollbar
@@ -105,15 +185,13 @@ class PaxFlipClean:
         title_frame.pack(fill='x')
         
         # Load and display logo if available
-        if PIL_AVAILABLE and os.path.exists('isl_logo.jpg'):
-            try:
-                logo_img = Image.open('isl_logo.jpg')
-                logo_img = logo_img.resize((80, 80), Image.Resampling.LANCZOS)
-                self.logo_photo = ImageTk.PhotoImage(logo_img)
+        try:
+            self.logo_photo = self.load_logo()
+            if self.logo_photo:
                 logo_label = tk.Label(title_frame, image=self.logo_photo, bg='white')
                 logo_label.pack(side='left', padx=(0, 20))
-            except Exception:
-                pass
+        except Exception:
+            pass
         
         # Title and subtitle
         title_text_frame = tk.Frame(title_frame, bg='white')
@@ -173,12 +251,50 @@ class PaxFlipClean:
                              bg=self.colors['primary'], fg='white',
                              font=('Arial', 10, 'bold'), relief='flat',
                              padx=12, pady=6)
-        about_btn.pack(side='left')
+        about_btn.pack(side='left', padx=(0, 10))
+        
+        diagnostics_btn = tk.Button(button_frame, text="📊 Diagnostics", 
+                                   command=self.show_diagnostics,
+                                   bg=self.colors['secondary'], fg=self.colors['text_primary'],
+                                   font=('Arial', 10, 'bold'), relief='flat',
+                                   padx=12, pady=6)
+        diagnostics_btn.pack(side='left')
         
         # Separator
         separator = tk.Frame(header_frame, height=2, bg=self.colors['secondary'])
         separator.pack(fill='x', pady=(20, 0))
         
+    def load_logo(self):
+        """Load the header logo, preferring the cached pre-resized copy"""
+        if not os.path.exists(LOGO_FILE):
+            return None
+        
+        # Tk reads the cached PNG natively, so no PIL decode or resize is needed
+        try:
+            if os.path.getmtime(LOGO_CACHE_FILE) >= os.path.getmtime(LOGO_FILE):
+                return tk.PhotoImage(file=LOGO_CACHE_FILE)
+        except (OSError, tk.TclError):
+            pass
+        
+        try:
+            from PIL import Image, ImageTk
+        except ImportError:
+            return None
+        
+        logo_img = Image.open(LOGO_FILE)
+        logo_img = logo_img.resize(LOGO_SIZE, Image.Resampling.LANCZOS)
+        
+        # Cache the resized logo for next time
+        try:
+            os.makedirs(os.path.dirname(LOGO_CACHE_FILE), exist_ok=True)
+            temp_file = LOGO_CACHE_FILE + '.tmp'
+            logo_img.save(temp_file, 'PNG')
+            os.replace(temp_file, LOGO_CACHE_FILE)
+        except OSError:
+            pass
+        
+        return ImageTk.PhotoImage(logo_img)
+        
     def create_content_area(self, parent):
         """Create the main content area"""
         # Description
@@ -307,6 +423,13 @@ class PaxFlipClean:
                             padx=18, pady=10)
         copy_btn.pack(side='left')
         
+        results_btn = tk.Button(button_frame, text="View Results",
+                               command=self.show_results,
+                               bg=self.colors['secondary'], fg=self.colors['text_primary'],
+                               font=('Arial', 11), relief='flat',
+                               padx=18, pady=10)
+        results_btn.pack(side='left', padx=(10, 0))
+        
         clear_btn = tk.Button(button_frame, text="Clear All",
                              command=self.clear_fields,
                              bg=self.colors['secondary'], fg=self.colors['text_primary'],
@@ -314,6 +437,14 @@ class PaxFlipClean:
                              padx=18, pady=10)
         clear_btn.pack(side='right')
         
+        # Batch progress
+        self.batch_progress = ttk.Progressbar(content, mode='determinate', maximum=1)
+        self.batch_progress.pack(fill='x', pady=(20, 6))
+        
+        tk.Label(content, textvariable=self.batch_status_var,
+                font=('Arial', 10), fg=self.colors['text_secondary'],
+                bg='white').pack(anchor='w')
+        
     def create_flipper_export_section(self, parent):
         """Create Flipper Zero export section"""
         content = self.create_card_frame(parent, "Flipper Zero Export")
@@ -345,6 +476,30 @@ class PaxFlipClean:
                                font=('Arial', 11), relief='flat',
                                padx=18, pady=10)
         preview_btn.pack(side='right')
+        
+        # Batch export buttons
+        batch_frame = tk.Frame(content, bg='white')
+        batch_frame.pack(fill='x', pady=(12, 0))
+        
+        batch_btn = tk.Button(batch_frame, text="Batch Export Token List...",
+                             command=self.start_batch_export,
+                             bg=self.colors['primary'], fg='white',
+                             font=('Arial', 11, 'bold'), relief='flat',
+                             padx=18, pady=8)
+        batch_btn.pack(side='left')
+        
+        self.cancel_batch_btn = tk.Button(batch_frame, text="Cancel Batch",
+                                         command=self.cancel_batch_export,
+                                         bg=self.colors['danger'], fg='white',
+                                         font=('Arial', 11, 'bold'), relief='flat',
+                                         padx=18, pady=8, state='disabled')
+        self.cancel_batch_btn.pack(side='left', padx=(10, 0))
+        
+        archive_check = tk.Checkbutton(batch_frame, text="Single archive",
+                                      variable=self.batch_archive_var,
+                                      font=('Arial', 10), fg=self.colors['text_primary'],
+                                      bg='white', activebackground='white')
+        archive_check.pack(side='right')
 
     # Core functionality methods
     def convert_token(self):
@@ -357,19 +512,9 @@ class PaxFlipClean:
                 messagebox.showwarning("Input Error", "Please enter a token number.")
                 return
             
-            # Convert to integer
-            token_decimal = int(token_str)
-            
-            if token_decimal < 0:
-                messagebox.showerror("Input Error", "Token number must be positive.")
-                return
-            
-            if token_decimal > 0xFFFFFFFF:  # 32-bit limit
-                messagebox.showerror("Input Error", "Token number is too large (exceeds 32-bit limit).")
-                return
-            
-            # Convert to hex and format to 8 digits with leading zeros
-            hex_value = format(token_decimal, '08X')
+            # Validate and convert to 8-digit hex
+            with metrics.timer("gui_convert"):
+                token_decimal, hex_value = engine_convert_token(token_str)
             
             # Store current values
             self.current_token_decimal = token_str
@@ -379,13 +524,28 @@ class PaxFlipClean:
             self.hex_var.set(hex_value)
             
             # Auto-generate token name
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.flipper_name_var.set(f"Paxton_Token_{timestamp}")
+            self.flipper_name_var.set(default_token_name(token_decimal))
+            
+            # Add to the session results
+            self.current_result_index = self.results.add(token_decimal, self.flipper_name_var.get())
+            self.refresh_results()
+            
+            # Check the ledger for earlier issues of this token before recording this one
+            history = ""
+            ledger = self.get_ledger()
+            if ledger:
+                from paxflip_ledger import CONVERT, format_entry
+                with metrics.timer("ledger_check"):
+                    issued = ledger.first_export(token_decimal)
+                    if issued:
+                        history = f"\\n\\nAlready issued: {format_entry(issued)}"
+                    ledger.record(token_decimal, hex_value, self.flipper_name_var.get(), CONVERT)
+                    ledger.flush()
             
-            messagebox.showinfo("Success", f"Converted {token_decimal} to {hex_value}\\nReady to save as Flipper file!")
+            messagebox.showinfo("Success", f"Converted {token_decimal} to {hex_value}\\nReady to save as Flipper file!{history}")
             
-        except ValueError:
-            messagebox.showerror("Input Error", "Please enter a valid decimal number.")
+        except TokenError as e:
+            messagebox.showerror("Input Error", str(e))
         except Exception as e:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
     
@@ -394,6 +554,7 @@ class PaxFlipClean:
         hex_value = self.hex_var.get()
         if hex_value:
             try:
+                import pyperclip
                 pyperclip.copy(hex_value)
                 messagebox.showinfo("Copied", f"Hex code '{hex_value}' copied to clipboard!")
             except:
@@ -405,37 +566,24 @@ class PaxFlipClean:
             messagebox.showwarning("Nothing to Copy", "No hex code to copy. Please convert a token first.")
     
     def clear_fields(self):
-        """Clear all input and output fields"""
+        """Clear all input and output fields and the session results"""
         self.token_var.set("")
         self.hex_var.set("")
         self.flipper_name_var.set("Paxton_Token")
         self.current_token_decimal = ""
         self.current_token_hex = ""
+        self.results.clear()
+        self.current_result_index = None
+        self.refresh_results(resort=True)
         self.token_entry.focus()
     
     def format_hex_for_flipper(self, hex_string):
         """Format hex string for Flipper Zero RFID file (space-separated bytes)"""
-        # Remove any existing spaces and ensure uppercase
-        hex_clean = hex_string.replace(" ", "").upper()
-        
-        # Pad to 8 characters if needed
-        hex_clean = hex_clean.zfill(8)
-        
-        # Convert to space-separated bytes (2 hex digits each)
-        formatted = " ".join([hex_clean[i:i+2] for i in range(0, len(hex_clean), 2)])
-        
-        return formatted
+        return format_hex_for_flipper(hex_string)
     
     def generate_flipper_content(self, token_name, hex_data):
         """Generate Flipper Zero RFID file content"""
-        formatted_hex = self.format_hex_for_flipper(hex_data)
-        
-        content = f"""Filetype: Flipper RFID key
-Version: 1
-Key type: EM4100
-Data: {formatted_hex}
-"""
-        return content
+        return generate_flipper_content(token_name, hex_data)
     
     def save_flipper_file(self):
         """Save token as Flipper Zero .rfid file"""
@@ -446,25 +594,37 @@ Data: {formatted_hex}
             
         token_name = self.flipper_name_var.get().strip()
         if not token_name:
-            token_name = f"paxton_token_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            token_name = default_token_name(int(hex_value, 16))
             self.flipper_name_var.set(token_name)
             
-        # Clean filename
-        safe_name = re.sub(r'[^a-zA-Z0-9_-]', '_', token_name)
+        # Clean filename, tagged with the token number so names never collide
+        initial_file = rfid_filename(token_name, int(hex_value, 16))
         
         filename = filedialog.asksaveasfilename(
             title="Save Flipper Zero RFID File",
             defaultextension=".rfid",
             filetypes=[("RFID files", "*.rfid"), ("All files", "*.*")],
-            initialfile=f"{safe_name}.rfid"
+            initialfile=initial_file
         )
         
         if filename:
             try:
-                content = self.generate_flipper_content(token_name, hex_value)
+                with metrics.timer("gui_save_file"):
+                    data = get_exporter().render(TokenRecord(token_name, int(hex_value, 16), hex_value))
+                    
+                    with open(filename, 'wb') as f:
+                        f.write(data)
+                metrics.count("bytes_written", len(data))
                 
-                with open(filename, 'w') as f:
-                    f.write(content)
+                if self.current_result_index is not None:
+                    self.results.set_status(self.current_result_index, EXPORTED, token_name)
+                    self.refresh_results()
+                
+                ledger = self.get_ledger()
+                if ledger:
+                    from paxflip_ledger import EXPORT
+                    ledger.record(int(hex_value, 16), hex_value, token_name, EXPORT, filename)
+                    ledger.flush()
                     
                 messagebox.showinfo("Success", f"Flipper Zero file saved successfully!\\n\\nFile: {filename}\\nToken: {self.current_token_decimal}\\nHex: {hex_value}")
                 
@@ -500,63 +660,256 @@ Data: {formatted_hex}
         except Exception as e:
             messagebox.showerror("Preview Error", f"Failed to generate preview: {e}")
     
-    def check_net2_service(self):
-        """Check Net2 service status"""
-        try:
-            result = subprocess.run(['sc', 'query', 'Net2ClientSvc'], 
-                                  capture_output=True, text=True, shell=True)
+    def start_batch_export(self):
+        """Load a token list and convert/export it on a background thread"""
+        if self.batch_job and not self.batch_job.finished:
+            messagebox.showwarning("Batch Running", "A batch export is already running.")
+            return
             
-            if result.returncode == 0:
-                if 'RUNNING' in result.stdout:
-                    self.service_status_var.set("Net2ClientSvc: RUNNING (may conflict with direct USB)")
-                    self.service_label.config(fg=self.colors['warning'])
-                else:
-                    self.service_status_var.set("Net2ClientSvc: STOPPED (good for direct USB)")
-                    self.service_label.config(fg=self.colors['success'])
+        list_file = filedialog.askopenfilename(
+            title="Open Token List",
+            filetypes=[("Token lists", "*.txt *.csv"), ("Net2 exports", "*.csv *.xml"), ("All files", "*.*")]
+        )
+        if not list_file:
+            return
+            
+        if self.batch_archive_var.get():
+            archive = filedialog.asksaveasfilename(
+                title="Save Batch Archive",
+                defaultextension=".zip",
+                filetypes=[("Zip archive", "*.zip"), ("Tar archive", "*.tar *.tar.gz *.tgz")],
+                initialfile="paxflip_batch.zip"
+            )
+            if not archive:
+                return
+            destination = dict(archive=archive)
+        else:
+            output_dir = filedialog.askdirectory(title="Choose Folder for .rfid Files")
+            if not output_dir:
+                return
+            destination = dict(output_dir=output_dir, pipeline=True)
+            
+        # The batch machinery pulls in asyncio, zipfile and tarfile, so load it on first use
+        from paxflip_jobs import BatchJob
+        job = BatchJob(list_file, on_exported=self.record_batch_export,
+                       on_failed=self.record_batch_failure, **destination)
+            
+        self.get_ledger()
+        self.batch_job = job
+        self.batch_duplicates = 0
+        # The list is counted on the worker thread; bounce the bar until the total is known
+        self.batch_counting = True
+        self.batch_progress.config(mode='indeterminate', value=0)
+        self.batch_progress.start(BATCH_POLL_MS)
+        self.cancel_batch_btn.config(state='normal')
+        job.start()
+        self.poll_batch_job()
+    
+    def record_batch_export(self, record, path):
+        """Add an exported batch token to the session results and ledger (worker thread)"""
+        self.results.add(record.decimal, record.name, EXPORTED)
+        if self.ledger:
+            from paxflip_ledger import EXPORT
+            if self.ledger.record(record.decimal, record.hex, record.name, EXPORT, path):
+                self.batch_duplicates += 1
+    
+    def record_batch_failure(self, record, path, exc):
+        """Add a batch token that failed to save to the session results (worker thread)"""
+        self.results.add(record.decimal, record.name, FAILED)
+    
+    def cancel_batch_export(self):
+        """Cancel the running batch export"""
+        if self.batch_job and not self.batch_job.finished:
+            self.batch_job.cancel()
+            self.batch_status_var.set("Cancelling batch...")
+    
+    def poll_batch_job(self):
+        """Refresh batch progress on a timer rather than once per token"""
+        job = self.batch_job
+        progress = job.progress()
+        rate = progress.processed / progress.elapsed if progress.elapsed else 0.0
+        
+        if self.batch_counting and progress.total is not None:
+            self.batch_counting = False
+            self.batch_progress.stop()
+            self.batch_progress.config(mode='determinate', maximum=max(progress.total, 1))
+        if not self.batch_counting:
+            self.batch_progress.config(value=progress.processed)
+        self.refresh_results(resort=progress.finished)
+        if self.batch_counting and not job.cancelled:
+            self.batch_status_var.set("Counting tokens...")
+        elif not job.cancelled or progress.finished:
+            self.batch_status_var.set(
+                f"{progress.processed}/{progress.total} tokens | {rate:,.0f} tokens/s | {progress.failed} failed")
+        
+        if progress.finished:
+            self.cancel_batch_btn.config(state='disabled')
+            if self.ledger:
+                self.ledger.flush()
+            if not (progress.total or progress.error or progress.cancelled):
+                messagebox.showwarning("Empty List", "The token list does not contain any tokens.")
             else:
-                self.service_status_var.set("Net2ClientSvc: NOT FOUND")
-                self.service_label.config(fg=self.colors['text_secondary'])
-                
-        except Exception:
-            self.service_status_var.set("Net2ClientSvc: Unable to check status")
-            self.service_label.config(fg=self.colors['text_secondary'])
+                self.show_batch_summary(job, progress)
+        else:
+            self.root.after(BATCH_POLL_MS, self.poll_batch_job)
     
-    def stop_net2_service(self):
-        """Stop Net2 service"""
-        try:
-            result = subprocess.run(['net', 'stop', 'Net2ClientSvc'], 
-                                  capture_output=True, text=True, shell=True)
+    def show_batch_summary(self, job, progress):
+        """Show the end-of-run summary with any failed lines"""
+        rate = progress.processed / progress.elapsed if progress.elapsed else 0.0
+        if progress.error:
+            outcome = f"Batch stopped with an error: {progress.error}"
+        elif progress.cancelled:
+            outcome = "Batch cancelled."
+        else:
+            outcome = "Batch complete."
+        destination = job.archive or job.output_dir
+        
+        summary_window = tk.Toplevel(self.root)
+        summary_window.title("Batch Export Summary")
+        summary_window.geometry("600x400")
+        summary_window.configure(bg='white')
+        
+        tk.Label(summary_window, text=outcome,
+                font=('Arial', 14, 'bold'), bg='white').pack(anchor='w', padx=25, pady=(15, 5))
+        
+        tk.Label(summary_window,
+                text=(f"Exported {progress.converted} of {progress.total} tokens to {destination}\n"
+                      f"{progress.failed} failed | {progress.elapsed:.1f} s | {rate:,.0f} tokens/s\n"
+                      f"{self.batch_duplicates} already in the token ledger"),
+                font=('Arial', 11), fg=self.colors['text_secondary'], bg='white',
+                justify='left').pack(anchor='w', padx=25, pady=(0, 10))
+        
+        if job.pipeline:
+            tk.Label(summary_window, text=job.pipeline.format_stats(),
+                    font=('Courier', 9), fg=self.colors['text_secondary'], bg='white',
+                    justify='left').pack(anchor='w', padx=25, pady=(0, 10))
+        
+        if job.errors:
+            errors_table = ttk.Treeview(summary_window, columns=('line', 'token', 'error'),
+                                        show='headings', height=10)
+            errors_table.heading('line', text='Line')
+            errors_table.heading('token', text='Token')
+            errors_table.heading('error', text='Error')
+            errors_table.column('line', width=60, anchor='e')
+            errors_table.column('token', width=120)
+            errors_table.column('error', width=360)
+            for line_number, token, message in job.errors:
+                errors_table.insert('', 'end', values=(line_number or '', token, message))
+            errors_table.pack(fill='both', expand=True, padx=25, pady=(0, 25))
+    
+    def get_ledger(self):
+        """Open the token ledger on first use (None if it can't be opened)"""
+        if self.ledger is None and not self.ledger_unavailable:
+            try:
+                # sqlite3 is only loaded once the ledger is first needed
+                from paxflip_ledger import Ledger
+                self.ledger = Ledger()
+            except Exception:
+                # The ledger is a convenience and must never stop conversions
+                self.ledger_unavailable = True
+        return self.ledger
+    
+    def show_results(self):
+        """Show every token converted or exported this session"""
+        if self.results_window and self.results_window.winfo_exists():
+            self.results_window.lift()
+            return
             
-            if result.returncode == 0:
-                messagebox.showinfo("Success", "Net2ClientSvc stopped successfully")
-                self.check_net2_service()
+        self.results_window = tk.Toplevel(self.root)
+        self.results_window.title("Session Results")
+        self.results_window.geometry("680x560")
+        self.results_window.configure(bg='white')
+        
+        filter_frame = tk.Frame(self.results_window, bg='white')
+        filter_frame.pack(fill='x', padx=25, pady=(15, 10))
+        
+        tk.Label(filter_frame, text="Filter:", font=('Arial', 11, 'bold'),
+                fg=self.colors['text_primary'], bg='white').pack(side='left')
+        
+        filter_var = tk.StringVar()
+        filter_entry = tk.Entry(filter_frame, textvariable=filter_var, font=('Arial', 11),
+                               relief='solid', bd=1)
+        filter_entry.pack(side='left', fill='x', expand=True, padx=(8, 0), ipady=4)
+        filter_entry.bind('<Return>', lambda event: self.results_view.set_filter(filter_var.get()))
+        
+        self.results_view = VirtualResultsView(self.results_window, self.results, bg='white')
+        self.results_view.pack(fill='both', expand=True, padx=25, pady=(0, 25))
+    
+    def refresh_results(self, resort=False):
+        """Redraw the results grid if it is open"""
+        if self.results_window and self.results_window.winfo_exists():
+            if resort:
+                self.results_view.apply()
             else:
-                messagebox.showerror("Error", f"Failed to stop service: {result.stderr}")
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error stopping service: {str(e)}")
+                self.results_view.refresh()
+    
+    def check_net2_service(self):
+        """Check Net2 service status (runs on the service worker thread)"""
+        self.service_worker.submit(QUERY)
+    
+    def stop_net2_service(self):
+        """Stop Net2 service"""
+        self.set_service_busy("Net2ClientSvc: Stopping...")
+        self.service_worker.submit(STOP)
     
     def start_net2_service(self):
         """Start Net2 service"""
-        try:
-            result = subprocess.run(['net', 'start', 'Net2ClientSvc'], 
-                                  capture_output=True, text=True, shell=True)
+        self.set_service_busy("Net2ClientSvc: Starting...")
+        self.service_worker.submit(START)
+    
+    def set_service_busy(self, message):
+        """Show a pending service action and block repeat clicks"""
+        self.displayed_service_state = None
+        self.service_status_var.set(message)
+        self.service_label.config(fg=self.colors['text_secondary'])
+        self.stop_service_btn.config(state='disabled')
+        self.start_service_btn.config(state='disabled')
+    
+    def poll_service_results(self):
+        """Apply results from the service worker on the Tk main thread"""
+        for result in self.service_worker.drain():
+            # Only touch the status display when the state has actually changed
+            if result.state != self.displayed_service_state or result.action != QUERY:
+                self.show_service_state(result.state)
             
-            if result.returncode == 0:
-                messagebox.showinfo("Success", "Net2ClientSvc started successfully")
-                self.check_net2_service()
-            else:
-                messagebox.showerror("Error", f"Failed to start service: {result.stderr}")
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Error starting service: {str(e)}")
+            if result.action != QUERY:
+                self.stop_service_btn.config(state='normal')
+                self.start_service_btn.config(state='normal')
+                verb = "stopped" if result.action == STOP else "started"
+                if result.ok:
+                    messagebox.showinfo("Success", f"Net2ClientSvc {verb} successfully")
+                else:
+                    messagebox.showerror("Error", f"Failed to {result.action} service: {result.message}")
+        
+        self.service_poll_id = self.root.after(SERVICE_POLL_MS, self.poll_service_results)
+    
+    def show_service_state(self, state):
+        """Display a Net2 service state"""
+        self.displayed_service_state = state
+        if state == RUNNING:
+            self.service_status_var.set("Net2ClientSvc: RUNNING (may conflict with direct USB)")
+            self.service_label.config(fg=self.colors['warning'])
+        elif state == STOPPED:
+            self.service_status_var.set("Net2ClientSvc: STOPPED (good for direct USB)")
+            self.service_label.config(fg=self.colors['success'])
+        elif state == PENDING:
+            self.service_status_var.set("Net2ClientSvc: PENDING (changing state...)")
+            self.service_label.config(fg=self.colors['warning'])
+        elif state == NOT_FOUND:
+            self.service_status_var.set("Net2ClientSvc: NOT FOUND")
+            self.service_label.config(fg=self.colors['text_secondary'])
+        else:
+            self.service_status_var.set("Net2ClientSvc: Unable to check status")
+            self.service_label.config(fg=self.colors['text_secondary'])
     
     def open_website(self):
         """Open company website"""
+        import webbrowser
         webbrowser.open("https://www.intercomserviceslondon.co.uk")
         
     def open_github(self):
         """Open GitHub repository"""
+        import webbrowser
         webbrowser.open("https://github.com/ISLKey/PaxFlip")
         
     def show_about(self):
@@ -582,15 +935,123 @@ Supports manual entry with complete .rfid file export.
 """
         messagebox.showinfo("About PaxFlip Professional", about_text)
     
+    def show_diagnostics(self):
+        """Show collected timings and counters, with controls to collect and save them"""
+        window = tk.Toplevel(self.root)
+        window.title("PaxFlip Diagnostics")
+        window.geometry("720x480")
+        window.configure(bg='white')
+        
+        collect_var = tk.BooleanVar(value=metrics.enabled)
+        text_widget = tk.Text(window, font=('Courier', 10), wrap='none', bg='white')
+        
+        def refresh():
+            text_widget.config(state='normal')
+            text_widget.delete('1.0', 'end')
+            text_widget.insert('1.0', metrics.format_text())
+            text_widget.config(state='disabled')
+        
+        def toggle():
+            metrics.enable(collect_var.get())
+            refresh()
+        
+        def reset():
+            metrics.reset()
+            refresh()
+        
+        def save():
+            path = filedialog.asksaveasfilename(
+                title="Save Metrics",
+                defaultextension=".json",
+                filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")],
+                initialfile="paxflip_metrics.json"
+            )
+            if path:
+                try:
+                    metrics.dump(path)
+                except OSError as e:
+                    messagebox.showerror("Save Error", f"Failed to save metrics: {e}")
+        
+        controls = tk.Frame(window, bg='white')
+        controls.pack(fill='x', padx=15, pady=(15, 5))
+        tk.Checkbutton(controls, text="Collect metrics", variable=collect_var, command=toggle,
+                      bg='white').pack(side='left')
+        for label, command in (("Save...", save), ("Reset", reset), ("Refresh", refresh)):
+            tk.Button(controls, text=label, command=command, relief='flat',
+                     bg=self.colors['secondary'], padx=10).pack(side='right', padx=(5, 0))
+        
+        text_widget.pack(fill='both', expand=True, padx=15, pady=(5, 15))
+        refresh()
+    
+    def mark_startup(self, phase):
+        """Record the end of a startup phase when profiling startup or collecting metrics"""
+        if self.startup_timer:
+            self.startup_timer.mark(phase)
+        now = time.perf_counter()
+        metrics.observe(f"ui_{phase}", now - self.phase_started)
+        self.phase_started = now
+    
+    def finish_startup_profile(self):
+        """Print the startup profile once the mainloop first goes idle, then exit"""
+        self.mark_startup("first_idle")
+        print(self.startup_timer.report())
+        self.on_closing()
+    
     def on_closing(self):
         """Handle window closing"""
+        if self.batch_job and not self.batch_job.finished:
+            # The job records its exports in the ledger from its own thread, so
+            # let the files already in flight finish before closing the ledger
+            self.batch_job.cancel()
+            self.batch_job.wait()
+        if self.ledger:
+            self.ledger.close()
+        self.root.after_cancel(self.service_poll_id)
+        self.service_worker.shutdown()
+        if self.metrics_file:
+            try:
+                metrics.dump(self.metrics_file)
+            except OSError as e:
+                print(f"Failed to write metrics to {self.metrics_file}: {e}")
         self.root.destroy()
 
-def main():
+def main(argv=None):
     """Main application entry point"""
-    root = tk.Tk()
-    app = PaxFlipClean(root)
-    root.mainloop()
+    from paxflip_profile import (RUN, STARTUP, add_profile_arguments, profiler_from_args, save_profile,
+                                 start_phase, stop_phase)
+    
+    parser = argparse.ArgumentParser(description="PaxFlip Professional - Paxton Token to Flipper Zero Converter")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="print time to first idle broken down by startup phase, then exit")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="collect timings and counters and write them here on exit "
+                             "(Prometheus text for .prom/.txt, otherwise JSON)")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    profiler = profiler_from_args(args)
+    start_phase(RUN)
+    start_phase(STARTUP)
+    
+    try:
+        startup_timer = StartupTimer(_SCRIPT_START) if args.startup_profile else None
+        if startup_timer:
+            startup_timer.mark("imports")
+        
+        root = tk.Tk()
+        if startup_timer:
+            startup_timer.mark("tk_root")
+        
+        app = PaxFlipClean(root, startup_timer=startup_timer, metrics_file=args.metrics)
+        root.after_idle(stop_phase, STARTUP)
+        if startup_timer:
+            root.after_idle(app.finish_startup_profile)
+        
+        root.mainloop()
+    finally:
+        if profiler:
+            save_profile(profiler)
 
 if __name__ == "__main__":
     main()
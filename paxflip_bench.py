@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Benchmarks
+
+Reproducible timings for the hot paths: Flipper hex formatting, file
+content generation and rendering in every export format at 1, 10k and 1M
+tokens, .rfid export to tmpfs and to a regular directory, and construction
+of the GUI window under a virtual display with the Net2 service check
+stubbed out. Results are written as JSON so two commits can be compared,
+and a run can be checked against a saved baseline with a regression
+threshold.
+
+    python paxflip_bench.py -o baseline.json
+    python paxflip_bench.py --baseline baseline.json --threshold 0.10
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+
+from paxflip_engine import (TokenRecord, bulk_format_for_flipper, format_hex_for_flipper,
+                            generate_flipper_content, token_to_hex)
+from paxflip_export import write_rfid_files
+from paxflip_exporters import EXPORTERS
+
+SIZES = (1, 10_000, 1_000_000)
+EXPORT_SIZE = 10_000
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+
+# Batches faster than this are run in a loop so the timer resolution doesn't dominate
+MIN_SAMPLE_SECONDS = 0.05
+
+# Fixed seed so every run converts the same tokens
+SEED = 20240601
+
+TMPFS_CANDIDATES = ("/dev/shm", "/run/shm")
+
+
+def make_tokens(count, seed=SEED):
+    """Return count reproducible random 32-bit tokens"""
+    rng = random.Random(seed)
+    return array('I', (rng.getrandbits(32) for _ in range(count)))
+
+
+def time_call(func, repeat):
+    """Time func() repeat times, returning per-call seconds for each sample"""
+    start = time.perf_counter()
+    func()
+    once = time.perf_counter() - start
+    loops = max(1, int(MIN_SAMPLE_SECONDS / once)) if once else 1000
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        samples.append((time.perf_counter() - start) / loops)
+    return samples
+
+
+def summarise(samples, items=None):
+    """Reduce timing samples to the JSON result for one benchmark (items is the batch size, if any)"""
+    median = statistics.median(samples)
+    return {
+        "items": items,
+        "runs": len(samples),
+        "min": min(samples),
+        "median": median,
+        "max": max(samples),
+        "per_item_us": median / items * 1e6 if items else None,
+    }
+
+
+# Conversion and rendering
+
+def bench_rendering(sizes, repeat):
+    """Time per-token formatting and content generation, plus the bulk formatter"""
+    results = {}
+    for size in sizes:
+        tokens = make_tokens(size)
+        hexes = [token_to_hex(token) for token in tokens]
+        names = [f"Paxton_Token_{token}" for token in tokens]
+
+        def format_each():
+            for hex_value in hexes:
+                format_hex_for_flipper(hex_value)
+
+        def generate_each():
+            for name, hex_value in zip(names, hexes):
+                generate_flipper_content(name, hex_value)
+
+        def format_bulk():
+            bulk_format_for_flipper(tokens)
+
+        results[f"format_hex_for_flipper[{size}]"] = summarise(time_call(format_each, repeat), size)
+        results[f"generate_flipper_content[{size}]"] = summarise(time_call(generate_each, repeat), size)
+        results[f"bulk_format_for_flipper[{size}]"] = summarise(time_call(format_bulk, repeat), size)
+        results.update(bench_exporters(tokens, names, hexes, repeat))
+    return results
+
+
+def bench_exporters(tokens, names, hexes, repeat):
+    """Time rendering a batch into a reused buffer in every registered export format"""
+    records = [TokenRecord(name, token, hex_value) for name, token, hex_value in zip(names, tokens, hexes)]
+    buffer = bytearray()
+    results = {}
+    for name, exporter in EXPORTERS.items():
+        def render():
+            buffer.clear()
+            exporter.render_batch(records, buffer)
+
+        results[f"export_render_{name}[{len(records)}]"] = summarise(time_call(render, repeat), len(records))
+    return results
+
+
+# Export
+
+def find_tmpfs():
+    """Return a writable RAM-backed directory, or None"""
+    for candidate in TMPFS_CANDIDATES:
+        if os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+            return candidate
+    return None
+
+
+def bench_export(base_dir, count, repeat):
+    """Time write_rfid_files for count tokens into fresh folders under base_dir"""
+    records = [TokenRecord(f"Paxton_Token_{token}", token, token_to_hex(token)) for token in make_tokens(count)]
+    samples = []
+    for _ in range(repeat):
+        target = tempfile.mkdtemp(prefix="paxflip_bench_", dir=base_dir)
+        try:
+            start = time.perf_counter()
+            result = write_rfid_files(records, target)
+            samples.append(time.perf_counter() - start)
+        finally:
+            shutil.rmtree(target, ignore_errors=True)
+        if result.failed:
+            raise OSError(f"{result.failed} file(s) failed to write under {base_dir}")
+    return summarise(samples, count)
+
+
+def bench_exports(count, repeat, disk_dir=None):
+    """Compare export to tmpfs with export to a regular directory"""
+    results = {}
+    tmpfs = find_tmpfs()
+    if tmpfs:
+        results[f"export_tmpfs[{count}]"] = bench_export(tmpfs, count, repeat)
+    else:
+        results[f"export_tmpfs[{count}]"] = {"skipped": "no tmpfs directory found"}
+    results[f"export_disk[{count}]"] = bench_export(disk_dir or os.getcwd(), count, repeat)
+    return results
+
+
+# GUI startup
+
+def start_virtual_display():
+    """Start Xvfb when there is no display, returning (process, reason_skipped)"""
+    if os.environ.get("DISPLAY") or os.name == 'nt':
+        return None, None
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        return None, "no display and Xvfb is not installed"
+
+    for number in range(99, 120):
+        if os.path.exists(f"/tmp/.X11-unix/X{number}"):
+            continue
+        process = subprocess.Popen([xvfb, f":{number}", "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(50):
+            if os.path.exists(f"/tmp/.X11-unix/X{number}"):
+                os.environ["DISPLAY"] = f":{number}"
+                return process, None
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+        process.kill()
+    return None, "Xvfb did not start"
+
+
+def bench_gui(repeat):
+    """Time PaxFlipClean construction with the Net2 service check stubbed out"""
+    xvfb, skipped = start_virtual_display()
+    if skipped:
+        return {"gui_startup": {"skipped": skipped}}
+
+    try:
+        try:
+            import tkinter as tk
+            import PaxFlip_V3
+            from paxflip_service import FakeServiceBackend
+        except ImportError as e:
+            return {"gui_startup": {"skipped": f"GUI not importable: {e}"}}
+
+        original_check = PaxFlip_V3.PaxFlipClean.check_net2_service
+        PaxFlip_V3.PaxFlipClean.check_net2_service = lambda self: None
+        samples = []
+        try:
+            for _ in range(repeat):
+                root = tk.Tk()
+                start = time.perf_counter()
+                app = PaxFlip_V3.PaxFlipClean(root, service_backend=FakeServiceBackend())
+                root.update_idletasks()
+                samples.append(time.perf_counter() - start)
+                app.on_closing()
+        except tk.TclError as e:
+            return {"gui_startup": {"skipped": f"Tk unavailable: {e}"}}
+        finally:
+            PaxFlip_V3.PaxFlipClean.check_net2_service = original_check
+        return {"gui_startup": summarise(samples)}
+    finally:
+        if xvfb:
+            xvfb.terminate()
+            xvfb.wait()
+
+
+# Reporting
+
+def environment():
+    """Describe the machine and commit a run was taken on"""
+    info = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "commit": None,
+    }
+    try:
+        info["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        pass
+    try:
+        import numpy
+        info["numpy"] = numpy.__version__
+    except ImportError:
+        info["numpy"] = None
+    return info
+
+
+def compare(results, baseline, threshold):
+    """Return [(name, baseline_median, median, change)] for benchmarks slower than threshold"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous or "median" not in previous or "median" not in result:
+            continue
+        change = result["median"] / previous["median"] - 1 if previous["median"] else 0.0
+        if change > threshold:
+            regressions.append((name, previous["median"], result["median"], change))
+    return regressions
+
+
+def format_results(results):
+    """Describe results as aligned lines of text"""
+    lines = []
+    for name, result in results.items():
+        if "skipped" in result:
+            lines.append(f"{name:<40} skipped: {result['skipped']}")
+        else:
+            per_item = f"{result['per_item_us']:10.3f} us/token" if result["per_item_us"] is not None else ""
+            lines.append(f"{name:<40} {result['median'] * 1000:12.3f} ms  {per_item}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Run the benchmark suite"""
+    parser = argparse.ArgumentParser(description="Benchmark PaxFlip conversion, export and GUI startup.")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against an earlier JSON result file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fail when a median is this fraction slower than the baseline (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="samples per benchmark (default: %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="skip the 1M token sizes")
+    parser.add_argument("--export-count", type=int, default=EXPORT_SIZE,
+                        help="tokens written per export run (default: %(default)s)")
+    parser.add_argument("--disk-dir", help="regular directory to export into (default: current directory)")
+    parser.add_argument("--only", choices=("render", "export", "gui"), action="append",
+                        help="run only these groups (may be repeated)")
+    args = parser.parse_args(argv)
+
+    groups = args.only or ["render", "export", "gui"]
+    sizes = [size for size in SIZES if not (args.quick and size >= 1_000_000)]
+    repeat = max(1, args.repeat)
+
+    results = {}
+    if "render" in groups:
+        results.update(bench_rendering(sizes, repeat))
+    if "export" in groups:
+        results.update(bench_exports(args.export_count, repeat, args.disk_dir))
+    if "gui" in groups:
+        results.update(bench_gui(repeat))
+
+    print(format_results(results))
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get("results", {})
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms (+{change:.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Batch Command Line
+
+Converts Paxton token numbers to Flipper Zero .rfid files without the GUI.
+Tokens are streamed one per line from a file or stdin, optionally followed
+by a token name separated by a comma or whitespace:
+
+    12345678
+    12345679,Reception_Fob
+    12345680 Plant_Room
+    00 BC 61 51 Side_Gate
+
+User/token exports from Net2 can be read directly as CSV or XML; the
+format is taken from the file extension or given with --format.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import os
+import sys
+import threading
+
+from paxflip_engine import DEFAULT_TOKEN_NAME, convert_rows
+from paxflip_export import DEFAULT_WRITERS, archive_format_for, write_archive, write_export
+from paxflip_exporters import DEFAULT_EXPORTER, EXPORTERS
+from paxflip_ingest import CSV, FORMATS, LINES, XML, detect_format, iter_token_rows
+from paxflip_ledger import EXPORT, Ledger, default_ledger_path
+from paxflip_metrics import metrics
+from paxflip_parallel import ARCHIVE_EXTENSIONS, default_processes, export_sharded, export_sharded_file
+from paxflip_pipeline import ExportPipeline
+from paxflip_profile import (EXPORT as EXPORT_PHASE, RUN, add_profile_arguments, phase, profiler_from_args,
+                             save_profile)
+from paxflip_sync import sync_rfid_files
+from paxflip_validate import ValidationReport, validate_rows
+
+
+def convert_stream(stream, output_dir, name_prefix=DEFAULT_TOKEN_NAME, out=None, err=None, archive=None,
+                   workers=DEFAULT_WRITERS, ledger=None, sync=False, prune=False,
+                   input_format=LINES, token_field=None, name_field=None, pipeline=False, processes=None,
+                   report=None, export_format=None, path=None):
+    """Convert every token in stream to .rfid output, returning (converted, failed)
+
+    stream is a token list, or a Net2 CSV/XML export when input_format says
+    so (token_field and name_field override the detected columns). Tokens
+    may be decimal or hex in any spelling paxflip_validate accepts. Every
+    invalid row is reported and the rest carry on; when a ValidationReport
+    is given, it also receives each error and write failure.
+
+    Files are written into output_dir by a pool of writer threads, or
+    streamed into a single zip/tar archive when an archive path is given.
+    With sync, only new or changed files are written (and with prune, files
+    from earlier syncs that are no longer wanted are removed).
+    With processes, the list is split into shards that are exported by that
+    many processes, each into its own part folder (or archive part, named
+    after archive), with one merged manifest. When path names the token
+    list file stream was opened from, each process reads and validates its
+    own part of the file.
+    With pipeline, files are written through the asyncio ExportPipeline and
+    its per-stage statistics are reported on err at the end.
+    export_format names another paxflip_exporters format, such as csv, to
+    write the batch as a single file in output_dir instead of .rfid files;
+    in an archive or a shard part the file becomes one member or one part.
+    sync compares and prunes .rfid files, so it always writes those.
+    Exports are recorded in ledger when one is given, with a warning for
+    tokens it already holds.
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    converted = 0
+    failed = 0
+    # With pipeline, invalid rows are reported from its reader thread
+    lock = threading.Lock()
+
+    def report_error(line_number, token_str, message):
+        nonlocal failed
+        with lock:
+            err.write(f"line {line_number}: {token_str!r}: {message}\n")
+            failed += 1
+
+    def log_export(record, path):
+        if ledger and ledger.record(record.decimal, record.hex, record.name, EXPORT, path):
+            with lock:
+                err.write(f"{record.decimal}: already in the token ledger\n")
+
+    rows = validate_rows(iter_token_rows(stream, input_format, token_field, name_field), report, report_error)
+    records = convert_rows(rows, name_prefix, report_error)
+
+    if processes:
+        source = path if path and input_format == LINES else rows
+        converted, part_failed = export_parts(source, output_dir, name_prefix, out, err, archive, processes,
+                                              log_export, report, export_format)
+        return converted, failed + part_failed
+
+    if archive:
+        def echo(records):
+            for record in records:
+                out.write(f"{record.decimal}\t{record.hex}\t{archive}\n")
+                log_export(record, archive)
+                yield record
+
+        converted = write_archive(archive, echo(records), exporter=export_format)
+        return converted, failed
+
+    def report_written(record, path):
+        out.write(f"{record.decimal}\t{record.hex}\t{path}\n")
+        log_export(record, path)
+
+    def report_failed(record, path, exc):
+        with lock:
+            err.write(f"failed to save {path}: {exc}\n")
+        if report:
+            report.error(None, str(record.decimal) if record else "", f"Failed to save {path}: {exc}")
+
+    if sync:
+        def report_pruned(path):
+            out.write(f"-\t-\t{path}\n")
+
+        result = sync_rfid_files(records, output_dir, prune=prune, max_workers=workers,
+                                 on_written=report_written, on_error=report_failed,
+                                 on_pruned=report_pruned)
+        err.write(f"Sync: {result.written} written, {result.unchanged} unchanged, {result.pruned} pruned\n")
+        return result.written + result.unchanged, failed + result.failed
+
+    if pipeline:
+        export = ExportPipeline(output_dir, name_prefix, workers, on_row_error=report_error,
+                                on_written=report_written, on_error=report_failed, exporter=export_format)
+        result = export.run(rows)
+        err.write(export.format_stats() + "\n")
+        return result.written, failed + result.failed
+
+    result = write_export(records, output_dir, export_format, max_workers=workers,
+                          on_written=report_written, on_error=report_failed)
+    return result.written, failed + result.failed
+
+
+def export_parts(source, output_dir, name_prefix, out, err, archive, processes, log_export, report=None,
+                 exporter=None):
+    """Run a sharded multi-process export for convert_stream, returning (converted, failed)
+
+    source is a token list path, which the worker processes read for
+    themselves, or an iterable of validated rows. exporter names the
+    paxflip_exporters format each part is written in.
+    """
+    failed = 0
+
+    def report_error(line_number, token_str, message):
+        nonlocal failed
+        err.write(f"line {line_number}: {token_str!r}: {message}\n")
+        failed += 1
+
+    def report_written(record, path):
+        out.write(f"{record.decimal}\t{record.hex}\t{path}\n")
+        log_export(record, path)
+
+    options = {}
+    if archive:
+        # site_fobs.zip -> site_fobs-0000.zip, ... and site_fobs-manifest.csv beside it
+        archive_format = archive_format_for(archive)
+        output_dir = os.path.dirname(archive) or "."
+        stem = os.path.basename(archive)
+        for extension in (".tgz", ARCHIVE_EXTENSIONS[archive_format]):
+            if stem.lower().endswith(extension):
+                stem = stem[:-len(extension)]
+                break
+        options = dict(archive_format=archive_format, prefix=stem, manifest_name=f"{stem}-manifest.csv")
+
+    export = export_sharded_file if isinstance(source, str) else export_sharded
+    result = export(source, output_dir, processes, name_prefix=name_prefix, on_written=report_written,
+                    on_error=report_error, report=report, exporter=exporter, **options)
+    err.write(f"Wrote {result.shards} part(s), manifest {result.manifest}\n")
+    return result.written, failed
+
+
+def build_parser():
+    """Create the command line argument parser"""
+    parser = argparse.ArgumentParser(
+        prog="paxflip",
+        description="Convert Paxton token numbers to Flipper Zero .rfid files.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="token list file, one token per line, or a Net2 CSV/XML export ('-' for stdin)")
+    parser.add_argument("-f", "--format", choices=FORMATS,
+                        help="input format (default: from the file extension, or lines for stdin)")
+    parser.add_argument("--token-column",
+                        help="CSV column or XML element/attribute holding the token number (default: detected)")
+    parser.add_argument("--name-column",
+                        help="CSV column or XML element/attribute holding the user name (default: detected)")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="directory to write .rfid files into (default: current directory)")
+    parser.add_argument("--name-prefix", default=DEFAULT_TOKEN_NAME,
+                        help="prefix for tokens without a name (default: %(default)s)")
+    parser.add_argument("-t", "--to", dest="export_format", choices=list(EXPORTERS), default=DEFAULT_EXPORTER,
+                        help="output format: rfid files, or one csv, jsonl or bin (uint32) file in the "
+                             "output directory (default: %(default)s)")
+    parser.add_argument("-a", "--archive",
+                        help="stream the output into one .zip/.tar/.tar.gz archive instead of separate files")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WRITERS,
+                        help="number of parallel file writers (default: %(default)s)")
+    parser.add_argument("-p", "--processes", type=int, nargs="?", const=0,
+                        help="split the list across this many processes (default: one per core), "
+                             "writing each shard into its own part folder or archive")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="overlap reading, conversion and writing in an async pipeline "
+                             "and report per-stage statistics")
+    parser.add_argument("--sync", action="store_true",
+                        help="only write files that are new or changed since the last sync of the output directory")
+    parser.add_argument("--prune", action="store_true",
+                        help="with --sync, delete files from earlier syncs for tokens no longer in the list")
+    parser.add_argument("--ledger", nargs="?", const=default_ledger_path(),
+                        help="record exports in the token ledger and warn about tokens already issued "
+                             "(optionally give the ledger file)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="collect timings and counters and write them here at the end "
+                             "(Prometheus text for .prom/.txt, otherwise JSON)")
+    parser.add_argument("--report",
+                        help="write every invalid row and failed write to this file as JSON lines")
+    add_profile_arguments(parser, (RUN, EXPORT_PHASE))
+    return parser
+
+
+def main(argv=None):
+    """Batch command line entry point"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.export_format != DEFAULT_EXPORTER and args.sync:
+        parser.error("--sync only writes .rfid files")
+    profiler = profiler_from_args(args)
+    try:
+        with phase(RUN):
+            return _run(args)
+    finally:
+        if profiler:
+            save_profile(profiler)
+
+
+def _run(args):
+    """Run the batch conversion for parsed arguments"""
+    if not args.archive:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.metrics:
+        metrics.enable()
+
+    input_format = args.format or (LINES if args.input == "-" else detect_format(args.input))
+    ledger = Ledger(args.ledger) if args.ledger else None
+    options = dict(archive=args.archive, workers=args.workers, ledger=ledger, sync=args.sync,
+                   prune=args.prune, pipeline=args.pipeline, input_format=input_format,
+                   processes=default_processes() if args.processes == 0 else args.processes,
+                   token_field=args.token_column, name_field=args.name_column,
+                   export_format=args.export_format, path=None if args.input == "-" else args.input)
+    report_file = open(args.report, 'w', encoding='utf-8') if args.report else None
+    report = options["report"] = ValidationReport(report_file, source=args.input)
+    try:
+        with phase(EXPORT_PHASE):
+            if args.input == "-":
+                # XML is parsed from bytes so its encoding declaration is honoured
+                stream = sys.stdin.buffer if input_format == XML else sys.stdin
+                converted, failed = convert_stream(stream, args.output_dir, args.name_prefix, **options)
+            elif input_format == XML:
+                with open(args.input, 'rb') as stream:
+                    converted, failed = convert_stream(stream, args.output_dir, args.name_prefix, **options)
+            elif input_format == CSV:
+                with open(args.input, 'r', newline='', encoding='utf-8-sig') as stream:
+                    converted, failed = convert_stream(stream, args.output_dir, args.name_prefix, **options)
+            else:
+                with open(args.input, 'r') as stream:
+                    converted, failed = convert_stream(stream, args.output_dir, args.name_prefix, **options)
+    except (ValueError, SyntaxError) as e:
+        # Unrecognised CSV header or malformed XML
+        sys.stderr.write(f"{args.input}: {e}\n")
+        return 1
+    finally:
+        if ledger:
+            ledger.close()
+        if report_file:
+            report_file.close()
+        if args.metrics:
+            metrics.dump(args.metrics)
+
+    sys.stderr.write(f"Validated {report.format_summary()}\n")
+    sys.stderr.write(f"Converted {converted} token(s), {failed} failed\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
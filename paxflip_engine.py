@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Conversion Engine
+
+Pure token conversion and Flipper Zero .rfid rendering shared by the GUI
+and the batch command line. This module never imports tkinter, so it can
+be used headless on build servers and from other tooling.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import os
+import re
+import time
+from array import array
+from collections import namedtuple
+
+from paxflip_metrics import metrics
+
+# Paxton tokens are stored as 32-bit EM4100 IDs
+MAX_TOKEN = 0xFFFFFFFF
+
+DEFAULT_TOKEN_NAME = "Paxton_Token"
+RFID_EXTENSION = ".rfid"
+
+# Precomputed byte -> two hex digit lookup used by the bulk converters
+BYTE_HEX = tuple(format(i, '02X') for i in range(256))
+
+# Token spellings with a space or comma inside them: hex bytes ("00 BC 61 4E",
+# also with : or -) and grouped thousands ("12,345,678" or "12 345 678")
+HEX_BYTES_PATTERN = r'[0-9A-Fa-f]{2}(?:[ :\-][0-9A-Fa-f]{2}){3,4}'
+DECIMAL_GROUPED_PATTERN = r'\d{1,3}(?:[ ,]\d{3})+'
+
+# The longest such token at the start of a token list line, ending at a separator
+SPACED_TOKEN = re.compile(rf'(?:{HEX_BYTES_PATTERN}|{DECIMAL_GROUPED_PATTERN})(?=[,\s]|$)')
+
+
+# One converted token ready for export
+TokenRecord = namedtuple('TokenRecord', ['name', 'decimal', 'hex'])
+
+
+class TokenError(ValueError):
+    """Raised when a token number cannot be converted"""
+
+
+def parse_token(token_str):
+    """Validate a decimal token number and return it as an int"""
+    token_str = token_str.strip()
+    if not token_str:
+        raise TokenError("Please enter a token number.")
+
+    try:
+        token_decimal = int(token_str)
+    except ValueError:
+        raise TokenError("Please enter a valid decimal number.")
+
+    if token_decimal < 0:
+        raise TokenError("Token number must be positive.")
+
+    if token_decimal > MAX_TOKEN:
+        raise TokenError("Token number is too large (exceeds 32-bit limit).")
+
+    return token_decimal
+
+
+def token_to_hex(token_decimal):
+    """Convert a validated token number to 8-digit hex with leading zeros"""
+    return format(token_decimal, '08X')
+
+
+def convert_token(token_str):
+    """Convert a decimal token string, returning (decimal, hex)"""
+    token_decimal = parse_token(token_str)
+    return token_decimal, token_to_hex(token_decimal)
+
+
+def format_hex_for_flipper(hex_string):
+    """Format hex string for Flipper Zero RFID file (space-separated bytes)"""
+    # Remove any existing spaces and ensure uppercase
+    hex_clean = hex_string.replace(" ", "").upper()
+
+    # Pad to 8 characters if needed
+    hex_clean = hex_clean.zfill(8)
+
+    # Convert to space-separated bytes (2 hex digits each)
+    return " ".join([hex_clean[i:i+2] for i in range(0, len(hex_clean), 2)])
+
+
+def generate_flipper_content(token_name, hex_data):
+    """Generate Flipper Zero RFID file content"""
+    formatted_hex = format_hex_for_flipper(hex_data)
+
+    content = f"""Filetype: Flipper RFID key
+Version: 1
+Key type: EM4100
+Data: {formatted_hex}
+"""
+    return content
+
+
+def parse_flipper_content(content):
+    """Recover (decimal, hex) from Flipper Zero RFID file content
+
+    The reverse of generate_flipper_content. Accepts the 4-byte data this
+    tool writes, and 5-byte EM4100 data whose leading byte is zero.
+    """
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = bytes(content).decode('ascii', errors='replace')
+
+    fields = {}
+    for line in content.splitlines():
+        key, sep, value = line.partition(':')
+        if sep:
+            fields[key.strip().lower()] = value.strip()
+
+    if fields.get('filetype') != "Flipper RFID key":
+        raise TokenError("Not a Flipper RFID key file.")
+    if fields.get('key type') != "EM4100":
+        raise TokenError(f"Unsupported key type '{fields.get('key type', '')}' (expected EM4100).")
+    if 'data' not in fields:
+        raise TokenError("Missing Data line.")
+
+    data = fields['data'].split()
+    if not all(len(part) == 2 for part in data) or len(data) not in (4, 5):
+        raise TokenError(f"Malformed Data line '{fields['data']}'.")
+    try:
+        raw = bytes.fromhex("".join(data))
+    except ValueError:
+        raise TokenError(f"Malformed Data line '{fields['data']}'.")
+    if len(raw) == 5:
+        if raw[0]:
+            raise TokenError(f"Data '{fields['data']}' does not fit a 32-bit Paxton token.")
+        raw = raw[1:]
+
+    token_decimal = int.from_bytes(raw, 'big')
+    return token_decimal, token_to_hex(token_decimal)
+
+
+def sanitise_name(token_name):
+    """Make a token name safe to use as a file name"""
+    return re.sub(r'[^a-zA-Z0-9_-]', '_', token_name)
+
+
+def rfid_filename(token_name, token_decimal):
+    """Build a deterministic, collision-free .rfid file name for a token
+
+    The token number is appended to the sanitised name unless the name
+    already ends with an underscore and that number. Either way the name
+    ends in _<decimal>, so different tokens never share a file name, even
+    when one name ends in digits (Door_11 for token 1 is Door_11_1).
+    """
+    safe_name = sanitise_name(token_name)
+    suffix = f"_{token_decimal}"
+    if not safe_name.endswith(suffix):
+        safe_name += suffix
+    return safe_name + RFID_EXTENSION
+
+
+def default_token_name(token_decimal, prefix=DEFAULT_TOKEN_NAME):
+    """Build the default name for a token"""
+    return f"{prefix}_{token_decimal}"
+
+
+def iter_token_lines(stream, first_line=1):
+    """Yield (line_number, token_str, name) for each token line in stream
+
+    Lines hold a token number optionally followed by a name, separated by a
+    comma or whitespace. A token spelled with spaces or commas, such as
+    "00 BC 61 4E" or "12,345,678", is taken whole. Blank lines and #
+    comments are skipped. first_line is the number of the first line in
+    stream, for reading part of a file.
+    """
+    for line_number, line in enumerate(stream, first_line):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        # Token first, optional name after a comma or whitespace
+        parts = re.split(r'[,\s]+', line, maxsplit=1)
+        if len(parts) > 1 and len(parts[0]) <= 3:
+            # Could be the first group of a spaced token; keep the whole token
+            match = SPACED_TOKEN.match(line)
+            if match:
+                parts = [match.group(), re.sub(r'^[,\s]+', '', line[match.end():])]
+        name = parts[1].strip() if len(parts) > 1 else ""
+        yield line_number, parts[0], name
+
+
+def convert_rows(rows, name_prefix=DEFAULT_TOKEN_NAME, on_error=None):
+    """Yield a TokenRecord for each valid (line_number, token_str, name) row
+
+    Rows that fail validation are passed to on_error(line_number, token_str, message).
+    """
+    timed = metrics.enabled
+    for line_number, token_str, name in rows:
+        start = time.perf_counter() if timed else 0.0
+        try:
+            token_decimal, hex_value = convert_token(token_str)
+        except TokenError as e:
+            if timed:
+                metrics.count("convert_errors")
+            if on_error:
+                on_error(line_number, token_str, str(e))
+            continue
+
+        if timed:
+            metrics.observe("convert", time.perf_counter() - start)
+        yield TokenRecord(name or default_token_name(token_decimal, name_prefix), token_decimal, hex_value)
+
+
+def app_data_dir():
+    """Return the per-user PaxFlip data directory ($PAXFLIP_HOME overrides it)"""
+    if os.environ.get("PAXFLIP_HOME"):
+        return os.environ["PAXFLIP_HOME"]
+    if os.name == 'nt' and os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "PaxFlip")
+    return os.path.join(os.path.expanduser("~"), ".paxflip")
+
+
+# Bulk conversion
+#
+# The bulk API takes a whole buffer of token numbers (a NumPy array, an
+# array('I') or any sequence of ints), checks the 32-bit range once for the
+# entire buffer and renders every token through the BYTE_HEX table. NumPy is
+# optional and only imported when a NumPy array is passed in.
+
+def _is_numpy_array(tokens):
+    """Check whether tokens is a NumPy array without importing NumPy"""
+    return type(tokens).__module__ == 'numpy' and hasattr(tokens, 'dtype')
+
+
+def as_token_array(tokens):
+    """Return tokens as a range-checked array('I') buffer"""
+    if isinstance(tokens, array) and tokens.typecode == 'I' and tokens.itemsize == 4:
+        # Unsigned 32-bit already, nothing can be out of range
+        return tokens
+
+    # A signed 64-bit buffer holds any candidate value so min/max can be checked in C
+    try:
+        wide = array('q', tokens)
+    except (OverflowError, TypeError) as e:
+        raise TokenError(f"Token buffer contains an invalid value: {e}")
+
+    if wide and (min(wide) < 0 or max(wide) > MAX_TOKEN):
+        index = next(i for i, t in enumerate(wide) if t < 0 or t > MAX_TOKEN)
+        raise TokenError(f"Token at index {index} ({wide[index]}) is outside the 32-bit range.")
+
+    return array('I', wide)
+
+
+def _numpy_render(tokens, spaced):
+    """Render a NumPy token array to hex strings with one vectorised table lookup"""
+    import numpy as np
+
+    tokens = np.asarray(tokens).ravel()
+    if tokens.dtype.kind not in 'iu':
+        raise TokenError(f"Token array must hold integers, not {tokens.dtype}.")
+
+    # Any bits above bit 31 (including the sign of negative values) are out of range
+    bad = None
+    if tokens.dtype.kind == 'i':
+        bad = (tokens.astype(np.int64) >> 32) != 0
+    elif tokens.dtype.itemsize > 4:
+        bad = tokens > MAX_TOKEN
+    if bad is not None and bad.any():
+        index = int(np.flatnonzero(bad)[0])
+        raise TokenError(f"Token at index {index} ({tokens[index]}) is outside the 32-bit range.")
+
+    table = np.frombuffer("".join(BYTE_HEX).encode('ascii'), dtype=np.uint8).reshape(256, 2)
+    token_bytes = tokens.astype('>u4').view(np.uint8).reshape(-1, 4)
+
+    # Two hex digits per byte, plus a separating space between bytes when spaced
+    step = 3 if spaced else 2
+    width = 11 if spaced else 8
+    out = np.full((len(tokens), width), ord(' '), dtype=np.uint8)
+    for i in range(4):
+        out[:, i * step:i * step + 2] = table[token_bytes[:, i]]
+
+    return out.view(f'S{width}').ravel().astype(f'U{width}').tolist()
+
+
+def _python_render(tokens, spaced):
+    """Render an array('I') token buffer to hex strings using the byte table"""
+    table = BYTE_HEX
+    sep = " " if spaced else ""
+    return [
+        sep.join((table[t >> 24], table[(t >> 16) & 0xFF], table[(t >> 8) & 0xFF], table[t & 0xFF]))
+        for t in as_token_array(tokens)
+    ]
+
+
+def bulk_token_to_hex(tokens):
+    """Convert a buffer of token numbers to 8-digit hex strings"""
+    if _is_numpy_array(tokens):
+        return _numpy_render(tokens, spaced=False)
+    return _python_render(tokens, spaced=False)
+
+
+def bulk_format_for_flipper(tokens):
+    """Convert a buffer of token numbers to space-separated Flipper Data: strings"""
+    if _is_numpy_array(tokens):
+        return _numpy_render(tokens, spaced=True)
+    return _python_render(tokens, spaced=True)
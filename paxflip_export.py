@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Bulk Export
+
+Writes batches of converted tokens out as Flipper Zero .rfid files. Large
+batches can be streamed into a single zip or tar archive in one sequential
+write, which is far quicker than creating thousands of small files on a
+USB-mounted Flipper SD card or network share. The archive is unpacked onto
+the card in one step afterwards. write_export also writes a batch in any of
+the other paxflip_exporters formats.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import csv
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from paxflip_exporters import get_exporter
+from paxflip_metrics import metrics
+
+# Table of contents written as the last member of every archive
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ["name", "decimal", "hex", "file"]
+
+# Name, before the extension, of a batch written in a single-file format
+EXPORT_STEM = "paxflip_tokens"
+
+ARCHIVE_FORMATS = {
+    ".zip": "zip",
+    ".tar": "tar",
+    ".tar.gz": "tar.gz",
+    ".tgz": "tar.gz",
+}
+
+
+class SeenFiles:
+    """The file names a batch has written so far, in about 8 bytes each
+
+    A file name is kept as its token number and a CRC-32 of the name, so
+    two names only clash if they share a token number and a checksum. Keys
+    are gathered in a small set that is folded into a sorted array whenever
+    it fills, so memory grows by 8 bytes per file rather than by a Python
+    string and a set slot.
+    """
+
+    def __init__(self, batch=65536):
+        self._recent = set()
+        self._sorted = array('Q')
+        self._batch = batch
+
+    def add(self, filename, decimal):
+        """Remember a file name, returning False if it had already been added"""
+        key = (decimal << 32) | zlib.crc32(filename.encode('utf-8'))
+        if key in self._recent:
+            return False
+        keys = self._sorted
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            return False
+        self._recent.add(key)
+        if len(self._recent) >= self._batch:
+            self._fold()
+        return True
+
+    def _fold(self):
+        keys = self._sorted
+        merged = array('Q')
+        start = 0
+        for key in sorted(self._recent):
+            end = bisect_left(keys, key, start)
+            merged += keys[start:end]
+            merged.append(key)
+            start = end
+        merged += keys[start:]
+        self._sorted = merged
+        self._recent.clear()
+
+
+def archive_format_for(path):
+    """Work out the archive format from a file name"""
+    lower = path.lower()
+    for suffix, archive_format in sorted(ARCHIVE_FORMATS.items(), key=lambda item: -len(item[0])):
+        if lower.endswith(suffix):
+            return archive_format
+    raise ValueError(f"Unsupported archive type for {path} (use .zip, .tar, .tar.gz or .tgz)")
+
+
+class _ZipSink:
+    """Stream members into a zip archive"""
+
+    def __init__(self, fileobj, mtime):
+        self.zip = zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED)
+        self.date_time = time.localtime(mtime)[:6]
+
+    def add(self, member_name, data):
+        info = zipfile.ZipInfo(member_name, date_time=self.date_time)
+        self.zip.writestr(info, data)
+
+    def add_stream(self, member_name, stream):
+        info = zipfile.ZipInfo(member_name, date_time=self.date_time)
+        # Known up front so a member over 2 GiB gets zip64 sizes
+        info.file_size = stream.seek(0, io.SEEK_END)
+        stream.seek(0)
+        with self.zip.open(info, 'w') as dest:
+            shutil.copyfileobj(stream, dest)
+
+    def close(self):
+        self.zip.close()
+
+
+class _TarSink:
+    """Stream members into a (optionally gzipped) tar archive"""
+
+    def __init__(self, fileobj, mtime, compressed):
+        self.tar = tarfile.open(fileobj=fileobj, mode='w|gz' if compressed else 'w|')
+        # A fractional mtime would need a pax header per member
+        self.mtime = int(mtime)
+
+    def _info(self, member_name, size):
+        info = tarfile.TarInfo(member_name)
+        info.size = size
+        info.mtime = self.mtime
+        info.mode = 0o644
+        return info
+
+    def add(self, member_name, data):
+        self.tar.addfile(self._info(member_name, len(data)), io.BytesIO(data))
+        # TarFile keeps every TarInfo it writes; a stream is never read back
+        self.tar.members.clear()
+
+    def add_stream(self, member_name, stream):
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        self.tar.addfile(self._info(member_name, size), stream)
+        self.tar.members.clear()
+
+    def close(self):
+        self.tar.close()
+
+
+def write_archive(target, records, archive_format=None, exporter=None):
+    """Stream TokenRecords into a zip or tar archive with a manifest.csv table of contents
+
+    target is a path or a writable binary file object. Each record is rendered
+    and written as it arrives, and the table of contents is spooled to a
+    temporary file. Repeats of the same token under the same name are only
+    stored once; the SeenFiles check behind that costs about 8 bytes per
+    token. A tar holds nothing else per member, but zipfile keeps a ZipInfo
+    for every member (a few hundred bytes each) to write the central
+    directory at the end, so use tar for the very largest batches.
+
+    exporter may name another paxflip_exporters format. A single-file format
+    is spooled to a temporary file and stored as one member named
+    EXPORT_STEM plus its extension, with every token listed against it in
+    the manifest. Returns the number of tokens written.
+    """
+    if archive_format is None:
+        archive_format = archive_format_for(target)
+
+    own_file = isinstance(target, str)
+    fileobj = open(target, 'wb') if own_file else target
+    exporter = get_exporter(exporter) if exporter is None or isinstance(exporter, str) else exporter
+    buffer = bytearray()
+    mtime = time.time()
+    seen = SeenFiles()
+    count = 0
+
+    try:
+        if archive_format == "zip":
+            sink = _ZipSink(fileobj, mtime)
+        else:
+            sink = _TarSink(fileobj, mtime, compressed=(archive_format == "tar.gz"))
+
+        with tempfile.TemporaryFile('w+b') as manifest_file:
+            manifest_text = io.TextIOWrapper(manifest_file, encoding='utf-8', newline='')
+            manifest = csv.writer(manifest_text)
+            manifest.writerow(MANIFEST_FIELDS)
+
+            if exporter.one_file_per_record:
+                for record in records:
+                    member_name = exporter.filename(record)
+                    if not seen.add(member_name, record.decimal):
+                        # Same name and token number means identical content
+                        continue
+
+                    with metrics.timer("generate_content"):
+                        buffer.clear()
+                        exporter.render_into(buffer, record)
+                        data = bytes(buffer)
+                    sink.add(member_name, data)
+                    metrics.count("bytes_archived", len(data))
+                    manifest.writerow([record.name, record.decimal, record.hex, member_name])
+                    count += 1
+            else:
+                member_name = EXPORT_STEM + exporter.extension
+
+                def listed(chunk):
+                    manifest.writerows([record.name, record.decimal, record.hex, member_name]
+                                       for record in chunk)
+
+                with tempfile.TemporaryFile('w+b') as spool:
+                    count = write_records(spool, records, exporter, on_chunk=listed)
+                    metrics.count("bytes_archived", spool.tell())
+                    sink.add_stream(member_name, spool)
+
+            manifest_text.flush()
+            manifest_text.detach()
+            manifest_file.seek(0)
+            sink.add_stream(MANIFEST_NAME, manifest_file)
+
+        sink.close()
+    finally:
+        if own_file:
+            fileobj.close()
+
+    return count
+
+
+# Parallel directory export
+
+BulkWriteResult = namedtuple('BulkWriteResult', ['written', 'skipped', 'failed'])
+
+DEFAULT_WRITERS = 8
+
+
+def temp_path_for(path):
+    """Name of the temporary file path is written under before being renamed into place"""
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".{filename}.{os.getpid()}.tmp")
+
+
+def write_file_atomic(path, data, fsync=False):
+    """Write data to a temporary file beside path and rename it into place"""
+    temp_path = temp_path_for(path)
+
+    try:
+        with metrics.timer("file_write"), open(temp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        metrics.count("bytes_written", len(data))
+    except BaseException:
+        metrics.count("file_write_errors")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def fsync_directory(path):
+    """Flush directory entries to disk (a no-op where directories can't be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Windows does not allow opening a directory
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_rfid_files(records, output_dir, max_workers=DEFAULT_WRITERS, fsync_files=False,
+                     on_written=None, on_error=None, exporter=None):
+    """Write TokenRecords as .rfid files into output_dir using a pool of writer threads
+
+    Each file is written under a temporary name and renamed into place, so a
+    card pulled mid-batch never holds a half-written key. File names come
+    from rfid_filename and are deterministic. Repeats of a file name are
+    skipped, which SeenFiles tracks in about 8 bytes per file. The directory
+    is fsynced once at the end of the batch.
+    exporter may name another file-per-token format from paxflip_exporters.
+
+    on_written(record, path) and on_error(record, path, exc) are called from
+    the calling thread in input order. Returns a BulkWriteResult.
+    """
+    exporter = get_exporter(exporter) if exporter is None or isinstance(exporter, str) else exporter
+    buffer = bytearray()
+    seen = SeenFiles()
+    written = 0
+    skipped = 0
+    failed = 0
+
+    # Bound the number of in-flight writes so memory stays flat for huge batches
+    window = max(1, max_workers) * 4
+    pending = deque()
+
+    def collect(entry):
+        nonlocal written, failed
+        record, path, future = entry
+        try:
+            future.result()
+        except Exception as e:
+            failed += 1
+            if on_error:
+                on_error(record, path, e)
+        else:
+            written += 1
+            if on_written:
+                on_written(record, path)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for record in records:
+            filename = exporter.filename(record)
+            if not seen.add(filename, record.decimal):
+                skipped += 1
+                continue
+
+            path = os.path.join(output_dir, filename)
+            with metrics.timer("generate_content"):
+                buffer.clear()
+                exporter.render_into(buffer, record)
+                data = bytes(buffer)
+            pending.append((record, path, pool.submit(write_file_atomic, path, data, fsync_files)))
+
+            if len(pending) >= window:
+                collect(pending.popleft())
+
+        while pending:
+            collect(pending.popleft())
+
+    if written:
+        fsync_directory(output_dir)
+
+    return BulkWriteResult(written, skipped, failed)
+
+
+# Single-file formats
+
+# Records rendered into the buffer between writes
+EXPORT_CHUNK = 1024
+
+
+def write_records(f, records, exporter, chunk_size=EXPORT_CHUNK, on_chunk=None):
+    """Write TokenRecords to an open binary file in a single-file exporter format
+
+    Records are rendered a chunk at a time into one reused bytearray, which
+    is written straight to f between the format's header and footer, so
+    memory stays flat. on_chunk(records) is called with the list of records
+    in each chunk once it is written. Returns the number of records written.
+    """
+    buffer = bytearray()
+    chunk = []
+    count = 0
+
+    def flush():
+        nonlocal chunk, count
+        buffer.clear()
+        with metrics.timer("generate_content"):
+            exporter.render_batch(chunk, buffer)
+        f.write(buffer)
+        metrics.count("bytes_written", len(buffer))
+        count += len(chunk)
+        if on_chunk and chunk:
+            on_chunk(chunk)
+        chunk = []
+
+    f.write(exporter.header)
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    f.write(exporter.footer)
+    return count
+
+
+def write_records_file(records, path, exporter, chunk_size=EXPORT_CHUNK, fsync=False, on_written=None):
+    """Stream TokenRecords into one file in a single-file exporter format
+
+    The file is written by write_records under a temporary name and renamed
+    into place at the end. on_written(record, path) is only called once the
+    file is in place, so with a callback the written chunks are held until
+    then. Returns the number of records written.
+    """
+    exporter = get_exporter(exporter) if isinstance(exporter, str) else exporter
+    temp_path = temp_path_for(path)
+    chunks = []
+
+    try:
+        with open(temp_path, 'wb') as f:
+            count = write_records(f, records, exporter, chunk_size, chunks.append if on_written else None)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    for chunk in chunks:
+        for record in chunk:
+            on_written(record, path)
+    return count
+
+
+def export_path(output_dir, exporter, stem=EXPORT_STEM):
+    """Where write_export puts a single-file format in output_dir"""
+    return os.path.join(output_dir, stem + exporter.extension)
+
+
+def write_export(records, output_dir, exporter=None, max_workers=DEFAULT_WRITERS, fsync_files=False,
+                 on_written=None, on_error=None, stem=EXPORT_STEM):
+    """Write TokenRecords into output_dir in any registered export format
+
+    File-per-token formats (such as the default .rfid) go through
+    write_rfid_files; the others are streamed into output_dir/stem plus the
+    format's extension by write_records_file. A failed single-file write is
+    passed to on_error(None, path, exc). Returns a BulkWriteResult.
+    """
+    exporter = get_exporter(exporter) if exporter is None or isinstance(exporter, str) else exporter
+    if exporter.one_file_per_record:
+        return write_rfid_files(records, output_dir, max_workers=max_workers, fsync_files=fsync_files,
+                                on_written=on_written, on_error=on_error, exporter=exporter)
+
+    path = export_path(output_dir, exporter, stem)
+    try:
+        written = write_records_file(records, path, exporter, fsync=fsync_files, on_written=on_written)
+    except OSError as e:
+        if on_error:
+            on_error(None, path, e)
+        return BulkWriteResult(0, 0, 1)
+    return BulkWriteResult(written, 0, 0)
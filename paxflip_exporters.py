@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Exporters
+
+Registry of output formats for converted tokens. Flipper Zero .rfid files
+are the default; a batch can also be written as one CSV, JSON Lines or
+fixed-width binary file of uint32 tokens.
+
+Records are rendered into a bytearray the caller reuses. .rfid and binary
+output is built from bytes directly, with hex digits copied in from a byte
+table. CSV and JSON Lines are text, so a whole chunk of records is
+formatted with f-strings and encoded in one go, and names are checked for
+characters that need quoting once per chunk rather than once per record.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import json
+import struct
+import sys
+from array import array
+
+from paxflip_engine import BYTE_HEX, RFID_EXTENSION, rfid_filename
+
+DEFAULT_EXPORTER = "rfid"
+
+# Byte -> two ASCII hex digits, and two digits plus a trailing space
+HEX_BYTES = tuple(digits.encode('ascii') for digits in BYTE_HEX)
+HEX_BYTES_SPACED = tuple(digits + b" " for digits in HEX_BYTES)
+
+# Flipper .rfid content up to the Data: bytes, and after them
+RFID_HEADER = b"Filetype: Flipper RFID key\nVersion: 1\nKey type: EM4100\nData: "
+RFID_FOOTER = b"\n"
+
+# Binary manifest: magic, format version and record size, then one little-endian uint32 per token
+BINARY_MAGIC = b"PAXFLIP\0"
+BINARY_VERSION = 1
+BINARY_HEADER = BINARY_MAGIC + struct.pack("<II", BINARY_VERSION, 4)
+
+
+class Exporter:
+    """One output format
+
+    Exporters with one_file_per_record write a file per token named by
+    filename(record); the others stream a whole batch into one file made of
+    header, each rendered record, then footer.
+    """
+
+    name = None
+    extension = None
+    description = ""
+    one_file_per_record = False
+    header = b""
+    footer = b""
+
+    def render_into(self, buffer, record):
+        """Append the bytes for one TokenRecord to buffer (a bytearray)"""
+        raise NotImplementedError
+
+    def render_batch(self, records, buffer):
+        """Append the bytes for a list of TokenRecords to buffer"""
+        render_into = self.render_into
+        for record in records:
+            render_into(buffer, record)
+
+    def render(self, record):
+        """Return the bytes for one TokenRecord"""
+        buffer = bytearray()
+        self.render_into(buffer, record)
+        return bytes(buffer)
+
+    def filename(self, record):
+        """File name for a record written on its own"""
+        raise NotImplementedError
+
+
+def _csv_plain(text):
+    """Check that a name (or many joined together) needs no CSV quoting"""
+    return not ('"' in text or ',' in text or '\r' in text or '\n' in text)
+
+
+def _json_plain(text):
+    """Check that a name (or many joined together) is printable ASCII needing no JSON escapes"""
+    return text.isascii() and text.isprintable() and '"' not in text and '\\' not in text
+
+
+def _append_hex(buffer, token, spaced):
+    table = HEX_BYTES_SPACED if spaced else HEX_BYTES
+    buffer += table[token >> 24]
+    buffer += table[(token >> 16) & 0xFF]
+    buffer += table[(token >> 8) & 0xFF]
+    buffer += HEX_BYTES[token & 0xFF]
+
+
+class RfidExporter(Exporter):
+    """Flipper Zero EM4100 .rfid key files, one per token"""
+
+    name = "rfid"
+    extension = RFID_EXTENSION
+    description = "Flipper Zero .rfid files, one per token"
+    one_file_per_record = True
+
+    def render_into(self, buffer, record):
+        # Appending table entries beats patching a template in place
+        buffer += RFID_HEADER
+        _append_hex(buffer, record.decimal, True)
+        buffer += RFID_FOOTER
+
+    def filename(self, record):
+        return rfid_filename(record.name, record.decimal)
+
+
+class CsvExporter(Exporter):
+    """One CSV table of name, decimal, hex and Flipper data"""
+
+    name = "csv"
+    extension = ".csv"
+    description = "CSV table of name, decimal, hex and Flipper data"
+    header = b"name,decimal,hex,flipper_data\r\n"
+
+    def render_into(self, buffer, record):
+        self.render_batch([record], buffer)
+
+    def render_batch(self, records, buffer):
+        table = BYTE_HEX
+        quote = not _csv_plain("".join([record.name for record in records]))
+        lines = []
+        for name, decimal, _ in records:
+            if quote and not _csv_plain(name):
+                name = '"' + name.replace('"', '""') + '"'
+            a, b, c, d = (table[decimal >> 24], table[(decimal >> 16) & 0xFF],
+                          table[(decimal >> 8) & 0xFF], table[decimal & 0xFF])
+            lines.append(f"{name},{decimal},{a}{b}{c}{d},{a} {b} {c} {d}\r\n")
+        buffer += "".join(lines).encode('utf-8')
+
+
+class JsonLinesExporter(Exporter):
+    """One JSON object per line"""
+
+    name = "jsonl"
+    extension = ".jsonl"
+    description = "JSON Lines, one object per token"
+
+    def render_into(self, buffer, record):
+        self.render_batch([record], buffer)
+
+    def render_batch(self, records, buffer):
+        table = BYTE_HEX
+        escape = not _json_plain("".join([record.name for record in records]))
+        lines = []
+        for name, decimal, _ in records:
+            if escape and not _json_plain(name):
+                name = json.dumps(name)
+            else:
+                name = f'"{name}"'
+            a, b, c, d = (table[decimal >> 24], table[(decimal >> 16) & 0xFF],
+                          table[(decimal >> 8) & 0xFF], table[decimal & 0xFF])
+            lines.append(f'{{"name": {name}, "decimal": {decimal}, "hex": "{a}{b}{c}{d}", '
+                         f'"flipper_data": "{a} {b} {c} {d}"}}\n')
+        buffer += "".join(lines).encode('ascii')
+
+
+class BinaryExporter(Exporter):
+    """Fixed-width binary manifest of little-endian uint32 tokens
+
+    A 16 byte header (b"PAXFLIP\\0", then the format version and record
+    size as uint32) is followed by 4 bytes per token, so the token count is
+    (file size - 16) / 4 and token i is at offset 16 + 4 * i.
+    """
+
+    name = "bin"
+    extension = ".bin"
+    description = "binary manifest of uint32 tokens"
+    header = BINARY_HEADER
+
+    def render_into(self, buffer, record):
+        buffer += record.decimal.to_bytes(4, 'little')
+
+    def render_batch(self, records, buffer):
+        tokens = array('I', [record.decimal for record in records])
+        if sys.byteorder == 'big':
+            tokens.byteswap()
+        buffer += tokens
+
+
+EXPORTERS = {}
+
+
+def register_exporter(exporter):
+    """Add an Exporter instance to the registry under its name"""
+    EXPORTERS[exporter.name] = exporter
+    return exporter
+
+
+def get_exporter(name=None):
+    """Return the registered exporter called name (.rfid by default)"""
+    name = (name or DEFAULT_EXPORTER).lower()
+    try:
+        return EXPORTERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown export format '{name}' (choose from {', '.join(EXPORTERS)})")
+
+
+for _exporter in (RfidExporter(), CsvExporter(), JsonLinesExporter(), BinaryExporter()):
+    register_exporter(_exporter)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - .rfid Importer
+
+Walks a directory tree such as a mounted Flipper SD card and recovers the
+token from every EM4100 .rfid file. Each file is read with a single
+unbuffered read and parsed on a pool of worker threads. Malformed files
+are reported without stopping the run.
+
+    python paxflip_import.py E:\\lfrfid -o audit.csv
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import csv
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from paxflip_engine import RFID_EXTENSION, TokenError, parse_flipper_content
+
+# Anything bigger than this cannot be a key file
+MAX_RFID_SIZE = 64 * 1024
+
+# Files handed to each worker task, to keep per-file scheduling overhead low
+CHUNK_SIZE = 256
+
+DEFAULT_READERS = 16
+
+ImportedToken = namedtuple('ImportedToken', ['path', 'name', 'decimal', 'hex'])
+
+
+def iter_rfid_files(root):
+    """Yield the path of every .rfid file under root, in a stable order"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.name.lower().endswith(RFID_EXTENSION):
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+
+def read_rfid_file(path):
+    """Read a whole .rfid file in one unbuffered read"""
+    with open(path, 'rb', buffering=0) as f:
+        data = f.read(MAX_RFID_SIZE + 1)
+    if len(data) > MAX_RFID_SIZE:
+        raise TokenError(f"File is larger than {MAX_RFID_SIZE} bytes.")
+    return data
+
+
+def parse_rfid_file(path):
+    """Return an ImportedToken for path, or (path, error message) if it can't be read"""
+    try:
+        token_decimal, hex_value = parse_flipper_content(read_rfid_file(path))
+    except (TokenError, OSError) as e:
+        return path, str(e)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return ImportedToken(path, name, token_decimal, hex_value)
+
+
+def _parse_chunk(paths):
+    return [parse_rfid_file(path) for path in paths]
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_rfid_tree(root, max_workers=DEFAULT_READERS, on_token=None, on_error=None):
+    """Parse every .rfid file under root on a worker pool, returning (imported, failed)
+
+    on_token(ImportedToken) and on_error(path, message) are called from the
+    calling thread in directory walk order.
+    """
+    imported = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        # Futures are collected first-in first-out, which keeps walk order and bounds memory
+        pending = deque()
+        window = max(1, max_workers) * 2
+
+        def collect(future):
+            nonlocal imported, failed
+            for result in future.result():
+                if isinstance(result, ImportedToken):
+                    imported += 1
+                    if on_token:
+                        on_token(result)
+                else:
+                    failed += 1
+                    if on_error:
+                        on_error(*result)
+
+        for chunk in _chunks(iter_rfid_files(root), CHUNK_SIZE):
+            pending.append(pool.submit(_parse_chunk, chunk))
+            if len(pending) >= window:
+                collect(pending.popleft())
+        for future in pending:
+            collect(future)
+
+    return imported, failed
+
+
+def main(argv=None):
+    """Audit a tree of .rfid files from the command line"""
+    parser = argparse.ArgumentParser(description="Recover Paxton tokens from a tree of Flipper .rfid files.")
+    parser.add_argument("root", help="directory to scan, e.g. a mounted Flipper SD card")
+    parser.add_argument("-o", "--output", help="write the token list as CSV here instead of stdout")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_READERS,
+                        help="number of parallel readers (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(["decimal", "hex", "name", "path"])
+
+        def on_token(token):
+            writer.writerow([token.decimal, token.hex, token.name, token.path])
+
+        def on_error(path, message):
+            sys.stderr.write(f"{path}: {message}\n")
+
+        imported, failed = import_rfid_tree(args.root, args.workers, on_token, on_error)
+    finally:
+        if args.output:
+            out.close()
+
+    sys.stderr.write(f"Imported {imported} token(s), {failed} malformed file(s)\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
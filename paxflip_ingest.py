@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Net2 Export Ingestion
+
+Streams user/token exports from Net2 (CSV or XML) into the converter as
+(row_number, token, name) rows. CSV is read row by row and XML with
+incremental iterparse, discarding each record once it has been handled, so
+memory stays flat however large the export is. Token and name columns are
+found from the header or element names, and can be given explicitly.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import csv
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+from paxflip_engine import iter_token_lines, sanitise_name
+
+# Input formats
+LINES = "lines"
+CSV = "csv"
+XML = "xml"
+FORMATS = (LINES, CSV, XML)
+
+# Column/element names recognised in Net2 exports, compared after normalise_field
+TOKEN_FIELDS = ("tokennumber", "token", "cardnumber", "card", "tokenid", "cardid", "number")
+NAME_FIELDS = ("username", "name", "fullname", "displayname")
+FIRST_NAME_FIELDS = ("firstname", "forename", "givenname")
+LAST_NAME_FIELDS = ("surname", "lastname", "familyname")
+
+# Some exports list several tokens for one user in a single cell
+TOKEN_SEPARATORS = re.compile(r'[;|]')
+
+
+def normalise_field(field):
+    """Lower-case a column or element name and drop everything but letters and digits"""
+    return re.sub(r'[^a-z0-9]', '', field.lower())
+
+
+def detect_format(path):
+    """Pick the input format from a file name"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return CSV
+    if extension == ".xml":
+        return XML
+    return LINES
+
+
+def _find(fields, candidates, override=None):
+    """Return the first field matching override or the candidate names, or None"""
+    normalised = {normalise_field(field): field for field in fields}
+    if override:
+        return normalised.get(normalise_field(override))
+    for candidate in candidates:
+        if candidate in normalised:
+            return normalised[candidate]
+    return None
+
+
+class FieldMap:
+    """Which fields of a record hold the token and the user's name"""
+
+    def __init__(self, fields, token_field=None, name_field=None):
+        self.token = _find(fields, TOKEN_FIELDS, token_field)
+        self.name = _find(fields, NAME_FIELDS, name_field)
+        self.first_name = None if self.name else _find(fields, FIRST_NAME_FIELDS)
+        self.last_name = None if self.name else _find(fields, LAST_NAME_FIELDS)
+
+    def rows(self, row_number, values):
+        """Yield (row_number, token_str, name) for each token in one record"""
+        if self.name:
+            name = values.get(self.name) or ""
+        else:
+            parts = (values.get(self.first_name) or "", values.get(self.last_name) or "")
+            name = " ".join(part.strip() for part in parts if part and part.strip())
+
+        name = sanitise_name(name.strip()) if name.strip() else ""
+        for token in TOKEN_SEPARATORS.split(values.get(self.token) or ""):
+            token = token.strip()
+            # Users without a token are not an error
+            if token:
+                yield row_number, token, name
+
+
+def iter_csv_rows(stream, token_field=None, name_field=None):
+    """Yield (row_number, token_str, name) rows from a CSV export with a header row"""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+
+    fields = FieldMap(header, token_field, name_field)
+    if fields.token is None:
+        raise ValueError(f"No token column found in CSV header {header}")
+
+    for row in reader:
+        if not row:
+            continue
+        yield from fields.rows(reader.line_num, dict(zip(header, row)))
+
+
+def iter_xml_rows(source, token_field=None, name_field=None):
+    """Yield (row_number, token_str, name) rows from an XML export
+
+    A record is any element with a token child element or attribute, e.g.
+    <User><Name>..</Name><TokenNumber>..</TokenNumber></User> or
+    <Token Number=".." UserName=".."/>. Each record is removed from the tree
+    as soon as it has been read.
+    """
+    stack = []
+    record_number = 0
+
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        values = dict(elem.attrib)
+        for child in elem:
+            if len(child) == 0:
+                values[child.tag] = (child.text or "").strip()
+
+        fields = FieldMap(values, token_field, name_field)
+        if fields.token is None or fields.token == elem.tag:
+            continue
+
+        record_number += 1
+        yield from fields.rows(record_number, values)
+
+        # Drop the finished record so the tree never grows
+        if stack:
+            stack[-1].remove(elem)
+        elem.clear()
+
+
+def iter_token_rows(source, input_format=None, token_field=None, name_field=None):
+    """Yield (row_number, token_str, name) rows from a token list, CSV or XML file
+
+    source is a path or an open text stream (for XML, a path or binary stream).
+    """
+    if input_format is None:
+        input_format = detect_format(source) if isinstance(source, str) else LINES
+
+    if input_format == XML:
+        yield from iter_xml_rows(source, token_field, name_field)
+        return
+
+    if isinstance(source, str):
+        with open(source, 'r', newline='', encoding='utf-8-sig') as stream:
+            yield from iter_token_rows(stream, input_format, token_field, name_field)
+        return
+
+    if input_format == CSV:
+        yield from iter_csv_rows(source, token_field, name_field)
+    else:
+        yield from iter_token_lines(source)
+
+
+def count_token_rows(path, input_format=None, token_field=None, name_field=None):
+    """Count the token rows in a file with one streaming pass"""
+    return sum(1 for _ in iter_token_rows(path, input_format, token_field, name_field))
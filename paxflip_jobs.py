@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Background Batch Jobs
+
+Converts and exports a whole token list on a worker thread so the GUI
+stays responsive. The GUI polls progress() on a timer instead of being
+called back once per token, and can cancel a job part way through.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from paxflip_engine import DEFAULT_TOKEN_NAME, convert_rows, iter_token_lines
+from paxflip_export import DEFAULT_WRITERS, write_archive, write_rfid_files
+from paxflip_ingest import iter_token_rows
+from paxflip_pipeline import ExportPipeline
+from paxflip_profile import EXPORT as EXPORT_PHASE, phase
+from paxflip_validate import validate_rows
+
+# Snapshot of a running or finished job
+BatchProgress = namedtuple('BatchProgress', [
+    'processed', 'total', 'converted', 'failed', 'elapsed', 'finished', 'cancelled', 'error',
+])
+
+# Number of failures kept for the end-of-run summary
+MAX_REPORTED_ERRORS = 1000
+
+
+def count_token_lines(lines):
+    """Count the lines of a token list that hold a token"""
+    return sum(1 for line in lines if line.strip() and not line.strip().startswith('#'))
+
+
+class BatchJob:
+    """Convert a token list and export it as .rfid files on a background thread
+
+    source is a list of token lines, or the path of a token list or Net2
+    CSV/XML export, which is streamed rather than loaded. A file is counted
+    on the worker thread before it is exported, so total is None until the
+    count is done. Output goes into output_dir as separate files, or into a
+    single zip/tar archive when archive is given. With pipeline, files are
+    written through an ExportPipeline whose per-stage statistics are
+    available while the job runs. on_exported(record, path) and
+    on_failed(record, path, exc) are called from the worker thread.
+    """
+
+    def __init__(self, source, output_dir=None, archive=None, name_prefix=DEFAULT_TOKEN_NAME,
+                 workers=DEFAULT_WRITERS, on_exported=None, on_failed=None, input_format=None,
+                 pipeline=False):
+        self.source = source
+        self.input_format = input_format
+        self.output_dir = output_dir
+        self.archive = archive
+        self.name_prefix = name_prefix
+        self.workers = workers
+        self.on_exported = on_exported
+        self.on_failed = on_failed
+        self.total = None if isinstance(source, str) else count_token_lines(source)
+
+        self.processed = 0
+        self.converted = 0
+        self.failed = 0
+        self.errors = []
+        self.error = None
+        self.started = None
+        self.ended = None
+
+        # In pipeline mode rows are validated on the reader thread but
+        # converted and written on the event loop thread
+        self._counter_lock = threading.Lock()
+        self._cancel = threading.Event()
+        self.pipeline = None
+        if pipeline and not archive:
+            self.pipeline = ExportPipeline(output_dir, name_prefix, workers,
+                                           on_row_error=self._record_error, on_converted=self._converted,
+                                           on_written=self._written, on_error=self._write_failed)
+        self._thread = threading.Thread(target=self._run, name="PaxFlipBatchJob", daemon=True)
+
+    def start(self):
+        """Start the job on its worker thread"""
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def cancel(self):
+        """Stop feeding new tokens; files already in flight are still completed"""
+        self._cancel.set()
+        if self.pipeline:
+            self.pipeline.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.ended is not None
+
+    def progress(self):
+        """Return a BatchProgress snapshot"""
+        end = self.ended or time.perf_counter()
+        elapsed = end - self.started if self.started else 0.0
+        return BatchProgress(self.processed, self.total, self.converted, self.failed,
+                             elapsed, self.finished, self.cancelled, self.error)
+
+    def wait(self, timeout=None):
+        """Block until the job has finished"""
+        self._thread.join(timeout)
+
+    def _record_error(self, line_number, token, message, processed=1):
+        with self._counter_lock:
+            self.processed += processed
+            self.failed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append((line_number, token, message))
+
+    def _count(self):
+        """Count the rows of a file source, or return None if cancelled part way"""
+        total = 0
+        for _ in iter_token_rows(self.source, self.input_format):
+            if self._cancel.is_set():
+                return None
+            total += 1
+        return total
+
+    def _rows(self):
+        """Yield validated rows; invalid ones are recorded and skipped"""
+        if isinstance(self.source, str):
+            rows = iter_token_rows(self.source, self.input_format)
+        else:
+            rows = iter_token_lines(self.source)
+        return validate_rows(rows, on_error=self._record_error)
+
+    def _records(self):
+        """Yield converted records until the list runs out or the job is cancelled"""
+        for record in convert_rows(self._rows(), self.name_prefix, self._record_error):
+            if self._cancel.is_set():
+                return
+            self._converted(record)
+            yield record
+
+    def _converted(self, record):
+        with self._counter_lock:
+            self.processed += 1
+
+    def _written(self, record, path):
+        with self._counter_lock:
+            self.converted += 1
+        if self.on_exported:
+            self.on_exported(record, path)
+
+    def _export(self):
+        if self.archive:
+            def archived(records):
+                for record in records:
+                    yield record
+                    self._written(record, self.archive)
+
+            write_archive(self.archive, archived(self._records()))
+        elif self.pipeline:
+            self.pipeline.run(self._rows())
+        else:
+            write_rfid_files(self._records(), self.output_dir, max_workers=self.workers,
+                             on_written=self._written, on_error=self._write_failed)
+
+    def _write_failed(self, record, path, exc):
+        # The record was already counted as processed when it was converted
+        self._record_error(None, str(record.decimal), f"Failed to save {path}: {exc}", processed=0)
+        if self.on_failed:
+            self.on_failed(record, path, exc)
+
+    def _run(self):
+        try:
+            if self.total is None:
+                self.total = self._count()
+            if self.total and not self._cancel.is_set():
+                with phase(EXPORT_PHASE):
+                    self._export()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            if self.total is None:
+                self.total = 0
+            self.ended = time.perf_counter()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Token Ledger
+
+A local SQLite record of every token converted or exported, kept across
+sessions so "have we already issued this fob?" can be answered instantly.
+Writes are buffered and committed in batches, and lookups by decimal, hex
+or name go through indexes.
+
+    python paxflip_ledger.py 12345678
+    python paxflip_ledger.py --hex 00BC614E
+    python paxflip_ledger.py --name Reception_Fob
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from paxflip_engine import MAX_TOKEN, app_data_dir, parse_token
+
+# Ledger actions
+CONVERT = "convert"
+EXPORT = "export"
+
+# Pending writes are committed once this many have built up
+DEFAULT_BATCH_SIZE = 500
+
+LedgerEntry = namedtuple('LedgerEntry', ['decimal', 'hex', 'name', 'path', 'action', 'created'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY,
+    decimal INTEGER NOT NULL,
+    hex TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT,
+    action TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_decimal ON tokens (decimal);
+CREATE INDEX IF NOT EXISTS tokens_name ON tokens (name);
+"""
+
+
+def default_ledger_path():
+    """Return the location of the per-user ledger database"""
+    return os.path.join(app_data_dir(), "ledger.sqlite3")
+
+
+class Ledger:
+    """Indexed, batch-written SQLite store of converted and exported tokens
+
+    Safe to share between the Tk main thread and batch worker threads.
+    Hex lookups are answered from the decimal index, since hex is just the
+    token number written in base 16.
+    """
+
+    def __init__(self, path=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path or default_ledger_path()
+        self.batch_size = batch_size
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_decimals = set()
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def record(self, decimal, hex_value, name, action=CONVERT, path=None):
+        """Buffer a ledger entry, returning True if the token was already in the ledger"""
+        with self._lock:
+            seen = decimal in self._pending_decimals or self._contains(decimal)
+            self._pending.append((decimal, hex_value, name, path, action, time.time()))
+            self._pending_decimals.add(decimal)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+        return seen
+
+    def flush(self):
+        """Commit every buffered entry in one transaction"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO tokens (decimal, hex, name, path, action, created) VALUES (?, ?, ?, ?, ?, ?)",
+                self._pending)
+        self._pending = []
+        self._pending_decimals = set()
+
+    def _contains(self, decimal):
+        row = self.conn.execute("SELECT 1 FROM tokens WHERE decimal = ? LIMIT 1", (decimal,)).fetchone()
+        return row is not None
+
+    def _select(self, where, value):
+        with self._lock:
+            self._flush()
+            rows = self.conn.execute(
+                f"SELECT decimal, hex, name, path, action, created FROM tokens WHERE {where} ORDER BY id",
+                (value,)).fetchall()
+        return [LedgerEntry(*row) for row in rows]
+
+    def contains(self, decimal):
+        """Check whether a token has ever been converted or exported"""
+        with self._lock:
+            return decimal in self._pending_decimals or self._contains(decimal)
+
+    def lookup_decimal(self, decimal):
+        """Return every ledger entry for a token number, oldest first"""
+        return self._select("decimal = ?", decimal)
+
+    def lookup_hex(self, hex_value):
+        """Return every ledger entry for an 8-digit hex token"""
+        decimal = int(hex_value.replace(" ", ""), 16)
+        if decimal > MAX_TOKEN:
+            return []
+        return self.lookup_decimal(decimal)
+
+    def lookup_name(self, name):
+        """Return every ledger entry recorded under a token name"""
+        return self._select("name = ?", name)
+
+    def first_export(self, decimal):
+        """Return the first time a token was exported, or None if it never has been"""
+        for entry in self.lookup_decimal(decimal):
+            if entry.action == EXPORT:
+                return entry
+        return None
+
+    def close(self):
+        """Commit anything pending and close the database"""
+        self.flush()
+        self.conn.close()
+
+
+def format_entry(entry):
+    """Format a ledger entry as one line of text"""
+    created = datetime.fromtimestamp(entry.created).strftime('%Y-%m-%d %H:%M:%S')
+    line = f"{created}  {entry.action:<7}  {entry.decimal:>10}  {entry.hex}  {entry.name}"
+    if entry.path:
+        line += f"  {entry.path}"
+    return line
+
+
+def main(argv=None):
+    """Look tokens up in the ledger from the command line"""
+    parser = argparse.ArgumentParser(description="Look up tokens in the PaxFlip ledger.")
+    parser.add_argument("token", nargs="?", help="decimal token number")
+    parser.add_argument("--hex", help="look up by 8-digit hex instead")
+    parser.add_argument("--name", help="look up by token name instead")
+    parser.add_argument("--ledger", help="ledger database (default: %(default)s)", default=default_ledger_path())
+    args = parser.parse_args(argv)
+
+    if not (args.token or args.hex or args.name):
+        parser.error("give a token number, --hex or --name")
+
+    ledger = Ledger(args.ledger)
+    try:
+        if args.hex:
+            entries = ledger.lookup_hex(args.hex)
+        elif args.name:
+            entries = ledger.lookup_name(args.name)
+        else:
+            entries = ledger.lookup_decimal(parse_token(args.token))
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        ledger.close()
+
+    for entry in entries:
+        print(format_entry(entry))
+    if not entries:
+        print("Not in ledger")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Metrics
+
+Lightweight timers and counters for the hot paths: conversion, .rfid
+content generation, file writes, sc/net service commands and GUI
+construction. Collection is off unless switched on (PAXFLIP_METRICS=1,
+--metrics, or the GUI diagnostics panel). While it is off, timer() hands
+back a shared do-nothing context manager and hot loops check the enabled
+flag once per batch, so the cost is close to nothing.
+
+Collected metrics can be dumped as JSON or in the Prometheus text format.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from array import array
+
+# Latency samples kept per timer; beyond this a uniform random sample is kept
+MAX_SAMPLES = 10000
+
+PERCENTILES = (50, 95, 99)
+
+PROMETHEUS_PREFIX = "paxflip_"
+
+
+class _NullTimer:
+    """Context manager that does nothing, used while metrics are disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    """Context manager that records its elapsed time under a name"""
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _Timing:
+    """Count, total and sampled latencies for one timer"""
+
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = array('d')
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            # Reservoir sampling keeps percentiles honest for long runs
+            index = random.randrange(self.count)
+            if index < MAX_SAMPLES:
+                self.samples[index] = seconds
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-pct * len(ordered) // 100))
+    return ordered[min(len(ordered), rank) - 1]
+
+
+class Metrics:
+    """Thread-safe registry of counters and timers"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+        self.started = time.time()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._timings = {}
+            self.started = time.time()
+
+    def count(self, name, value=1):
+        """Add value to a counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record one latency sample for a timer"""
+        if not self.enabled:
+            return
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = _Timing()
+            timing.add(seconds)
+
+    def timer(self, name):
+        """Context manager timing its body under name (a no-op while disabled)"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def snapshot(self):
+        """Return every counter and timer summary as a dict"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: (timing.count, timing.total, timing.max, sorted(timing.samples))
+                       for name, timing in self._timings.items()}
+
+        timers = {}
+        for name, (count, total, longest, ordered) in sorted(timings.items()):
+            summary = {"count": count, "total": total, "mean": total / count if count else 0.0, "max": longest}
+            for pct in PERCENTILES:
+                summary[f"p{pct}"] = percentile(ordered, pct)
+            timers[name] = summary
+
+        return {"enabled": self.enabled, "since": self.started,
+                "counters": dict(sorted(counters.items())), "timers": timers}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in snapshot["counters"].items():
+            metric = _prometheus_name(name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, summary in snapshot["timers"].items():
+            metric = _prometheus_name(name) + "_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for pct in PERCENTILES:
+                lines.append(f'{metric}{{quantile="{pct / 100}"}} {summary[f"p{pct}"]!r}')
+            lines.append(f"{metric}_sum {summary['total']!r}")
+            lines.append(f"{metric}_count {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def format_text(self):
+        """Describe the metrics as a plain text table for the diagnostics panel"""
+        snapshot = self.snapshot()
+        lines = [f"Collection {'on' if self.enabled else 'off'}, since "
+                 f"{time.strftime('%H:%M:%S', time.localtime(snapshot['since']))}", ""]
+        if snapshot["timers"]:
+            lines.append(f"{'Timer':<28}{'count':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+            for name, summary in snapshot["timers"].items():
+                lines.append(f"{name:<28}{summary['count']:>9}" + "".join(
+                    f"{summary[key] * 1000:>10.3f}" for key in ("p50", "p95", "p99", "max")))
+            lines.append("")
+        if snapshot["counters"]:
+            lines.append(f"{'Counter':<28}{'value':>12}")
+            for name, value in snapshot["counters"].items():
+                lines.append(f"{name:<28}{value:>12}")
+        if not snapshot["timers"] and not snapshot["counters"]:
+            lines.append("Nothing recorded yet.")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Write the metrics to path, as Prometheus text for .prom/.txt files and JSON otherwise"""
+        text = self.to_prometheus() if path.lower().endswith((".prom", ".txt")) else self.to_json()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def _prometheus_name(name):
+    return PROMETHEUS_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+# The registry shared by every module
+metrics = Metrics(enabled=os.environ.get("PAXFLIP_METRICS", "") not in ("", "0"))
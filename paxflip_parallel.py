@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Multi-Process Sharded Export
+
+Spreads a very large export over every core. The token stream is cut into
+shards, and each shard is converted, rendered and written by a separate
+process into its own folder (part-0000, part-0001, ...) or its own archive
+part (part-0000.zip, ...). A single-file export format, such as CSV, gives
+one file per shard instead (part-0000.csv, ...). Shard results come back in
+input order and are merged into one manifest.csv, so the output is the same
+however many processes ran.
+
+A token list file is cut into byte ranges that start on a line boundary,
+and each worker reads, validates and converts its own range, so the parent
+process never touches the rows. Other sources (Net2 CSV/XML exports and
+stdin) are read in the parent and sent to the workers in batches of rows.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import csv
+import io
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from paxflip_engine import DEFAULT_TOKEN_NAME, TokenRecord, convert_rows, iter_token_lines
+from paxflip_export import (EXPORT_STEM, MANIFEST_FIELDS, MANIFEST_NAME, SeenFiles, write_archive,
+                            write_records_file, write_rfid_files)
+from paxflip_exporters import get_exporter
+from paxflip_validate import FAILED, ValidationReport, validate_rows
+
+# Rows handed to a worker process at a time
+DEFAULT_SHARD_SIZE = 10000
+
+# Bytes of a token list file each worker reads for itself (about 10,000 lines)
+DEFAULT_SHARD_BYTES = 256 * 1024
+
+# Writer threads inside each worker process
+SHARD_WRITERS = 2
+
+ARCHIVE_EXTENSIONS = {"zip": ".zip", "tar": ".tar", "tar.gz": ".tar.gz"}
+
+# What a worker sends back: the part it wrote, the manifest rows for it in
+# input order, (line_number, token_str, message, code, name) for each
+# failure, the count of valid tokens by spelling, and the number of lines it
+# read (line numbers from a file range count from 1 within the range). The
+# file in a manifest row is None when the part is itself a single file.
+ShardResult = namedtuple('ShardResult', ['index', 'part', 'entries', 'errors', 'kinds', 'lines'])
+
+ShardedExportResult = namedtuple('ShardedExportResult', ['written', 'failed', 'shards', 'manifest'])
+
+
+def default_processes():
+    """Use every core"""
+    return os.cpu_count() or 1
+
+
+def part_name(index, prefix="part", archive_format=None):
+    """Return the folder or archive name for shard index"""
+    name = f"{prefix}-{index:04d}"
+    if archive_format:
+        name += ARCHIVE_EXTENSIONS[archive_format]
+    return name
+
+
+class _ShardReport(ValidationReport):
+    """Keeps every error for the parent process instead of writing it out"""
+
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+
+    def error(self, line_number, token_str, message, code=FAILED, name=None):
+        super().error(line_number, token_str, message, code, name)
+        self.entries.append((line_number, token_str, message, code, name))
+
+
+def _write_part(index, rows, output_dir, name_prefix, archive_format, prefix, exporter, report, lines=0):
+    """Convert validated rows and write them as one part (runs in a worker process)"""
+    exporter = get_exporter(exporter) if exporter is None or isinstance(exporter, str) else exporter
+    part = part_name(index, prefix, archive_format)
+    if not (archive_format or exporter.one_file_per_record):
+        part += exporter.extension
+    part_path = os.path.join(output_dir, part)
+    entries = []
+
+    records = convert_rows(rows, name_prefix, report.error)
+
+    if archive_format:
+        def listed(records):
+            for record in records:
+                if exporter.one_file_per_record:
+                    filename = exporter.filename(record)
+                else:
+                    filename = EXPORT_STEM + exporter.extension
+                entries.append((record.name, record.decimal, record.hex, filename))
+                yield record
+
+        write_archive(part_path, listed(records), archive_format, exporter)
+    elif not exporter.one_file_per_record:
+        def written(record, path):
+            entries.append((record.name, record.decimal, record.hex, None))
+
+        try:
+            write_records_file(records, part_path, exporter, on_written=written)
+        except OSError as e:
+            entries.clear()
+            report.error(None, "", f"Failed to save {part_path}: {e}")
+    else:
+        os.makedirs(part_path, exist_ok=True)
+
+        def written(record, path):
+            entries.append((record.name, record.decimal, record.hex, os.path.basename(path)))
+
+        def write_failed(record, path, exc):
+            report.error(None, str(record.decimal), f"Failed to save {path}: {exc}")
+
+        write_rfid_files(records, part_path, max_workers=SHARD_WRITERS,
+                         on_written=written, on_error=write_failed, exporter=exporter)
+
+    return ShardResult(index, part, entries, report.entries, report.kinds, lines)
+
+
+def _export_shard(index, rows, output_dir, name_prefix, archive_format, prefix, exporter):
+    """Convert and write one shard of validated rows (runs in a worker process)"""
+    return _write_part(index, rows, output_dir, name_prefix, archive_format, prefix, exporter, _ShardReport())
+
+
+def _export_range(index, path, start, end, output_dir, name_prefix, archive_format, prefix, exporter):
+    """Read, validate, convert and write one byte range of a token list (runs in a worker process)"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Decoded the same way as open(path, 'r'), newline handling included
+    lines = io.TextIOWrapper(io.BytesIO(data)).readlines()
+    report = _ShardReport()
+    rows = validate_rows(iter_token_lines(lines), report)
+    return _write_part(index, rows, output_dir, name_prefix, archive_format, prefix, exporter, report,
+                       len(lines))
+
+
+def _shards(rows, size):
+    shard = []
+    for row in rows:
+        shard.append(row)
+        if len(shard) >= size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def file_ranges(path, size=DEFAULT_SHARD_BYTES):
+    """Yield (start, end) byte ranges of about size bytes that each begin on a new line"""
+    total = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = 0
+        while start < total:
+            f.seek(min(start + size, total))
+            # Finish the line the cut landed in
+            f.readline()
+            end = min(f.tell(), total)
+            yield start, end
+            start = end
+
+
+def export_sharded(rows, output_dir, processes=None, shard_size=DEFAULT_SHARD_SIZE,
+                   name_prefix=DEFAULT_TOKEN_NAME, archive_format=None, prefix="part",
+                   manifest_name=MANIFEST_NAME, on_written=None, on_error=None, report=None, exporter=None):
+    """Export validated (line_number, token_str, name) rows across a pool of processes
+
+    Each shard is written into output_dir as its own folder, or as its own
+    archive when archive_format ("zip", "tar" or "tar.gz") is given. A merged
+    manifest listing every file once, in input order, is written to
+    output_dir/manifest_name. Duplicate file names in different shards have
+    identical content, so only the first is listed.
+
+    exporter may name another paxflip_exporters format. A single-file format
+    is written as one file per shard, or one member per archive part, and
+    every token in the shard is listed against it.
+
+    on_written(record, path) and on_error(line_number, token_str, message)
+    are called in this process in input order as shards complete, and
+    failures are also recorded in report when one is given. Returns a
+    ShardedExportResult.
+    """
+    tasks = ((_export_shard, (index, shard))
+             for index, shard in enumerate(_shards(rows, max(1, shard_size))))
+    return _run_shards(tasks, output_dir, processes, name_prefix, archive_format, prefix,
+                       manifest_name, on_written, on_error, report, exporter)
+
+
+def export_sharded_file(path, output_dir, processes=None, shard_bytes=DEFAULT_SHARD_BYTES,
+                        name_prefix=DEFAULT_TOKEN_NAME, archive_format=None, prefix="part",
+                        manifest_name=MANIFEST_NAME, on_written=None, on_error=None, report=None,
+                        exporter=None):
+    """Export a token list file across a pool of processes that each read their own part of it
+
+    The file is cut into line-aligned ranges of about shard_bytes, and each
+    worker validates and converts its range itself. Output, callbacks and
+    the result are the same as export_sharded; invalid rows are reported
+    with their line numbers in the file, and the valid ones are counted in
+    report by spelling.
+    """
+    tasks = ((_export_range, (index, path, start, end))
+             for index, (start, end) in enumerate(file_ranges(path, max(1, shard_bytes))))
+    return _run_shards(tasks, output_dir, processes, name_prefix, archive_format, prefix,
+                       manifest_name, on_written, on_error, report, exporter)
+
+
+def _run_shards(tasks, output_dir, processes, name_prefix, archive_format, prefix,
+                manifest_name, on_written, on_error, report, exporter):
+    """Run (function, leading args) shard tasks in a process pool and merge their results in order"""
+    processes = processes or default_processes()
+    exporter = get_exporter(exporter) if exporter is None or isinstance(exporter, str) else exporter
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, manifest_name)
+    temp_manifest = f"{manifest_path}.{os.getpid()}.tmp"
+
+    seen = SeenFiles()
+    written = 0
+    failed = 0
+    shards = 0
+    # Lines read by earlier file ranges, to turn range line numbers into file ones
+    line_offset = 0
+
+    with open(temp_manifest, 'w', newline='', encoding='utf-8') as manifest_file:
+        manifest = csv.writer(manifest_file)
+        manifest.writerow(MANIFEST_FIELDS)
+
+        def merge(future):
+            nonlocal written, failed, shards, line_offset
+            result = future.result()
+            shards += 1
+            part_path = os.path.join(output_dir, result.part)
+
+            for line_number, token_str, message, code, name in result.errors:
+                if line_number is not None:
+                    line_number += line_offset
+                failed += 1
+                if report:
+                    report.error(line_number, token_str, message, code, name)
+                if on_error:
+                    on_error(line_number, token_str, message)
+            if report:
+                for kind, count in result.kinds.items():
+                    report.accept(kind, count)
+            line_offset += result.lines
+
+            for name, decimal, hex_value, filename in result.entries:
+                # Only file-per-token formats can repeat a file
+                if exporter.one_file_per_record and not seen.add(filename, decimal):
+                    continue
+                written += 1
+                file_column = f"{result.part}/{filename}" if filename else result.part
+                manifest.writerow([name, decimal, hex_value, file_column])
+                if on_written:
+                    path = os.path.join(part_path, filename) if filename and not archive_format else part_path
+                    on_written(TokenRecord(name, decimal, hex_value), path)
+
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                # Shards are merged first-in first-out, which keeps input order and bounds memory
+                pending = deque()
+                window = processes * 2
+                for function, args in tasks:
+                    pending.append(pool.submit(function, *args, output_dir, name_prefix, archive_format, prefix,
+                                               exporter))
+                    if len(pending) >= window:
+                        merge(pending.popleft())
+                while pending:
+                    merge(pending.popleft())
+        except BaseException:
+            manifest_file.close()
+            os.remove(temp_manifest)
+            raise
+
+    os.replace(temp_manifest, manifest_path)
+    return ShardedExportResult(written, failed, shards, manifest_path)
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Async Export Pipeline
+
+Runs a big export as three overlapping stages joined by bounded asyncio
+queues:
+
+    read rows -> convert and render -> write .rfid files
+
+Rows are read and files written on worker threads, so conversion carries
+on while the output device is busy. Because the queues are bounded, a slow
+SD card or share holds the reader back instead of letting converted files
+pile up in memory. Each stage keeps throughput and queue-depth statistics.
+A single-file export format, such as CSV, is rendered a chunk at a time
+and appended in order by one writer.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from paxflip_engine import DEFAULT_TOKEN_NAME, convert_rows
+from paxflip_export import (DEFAULT_WRITERS, BulkWriteResult, SeenFiles, export_path, fsync_directory,
+                            temp_path_for, write_file_atomic)
+from paxflip_exporters import get_exporter
+from paxflip_metrics import metrics
+
+# Rows moved through the queues per item, to keep per-item asyncio overhead low
+CHUNK_SIZE = 256
+
+# Chunks each queue holds before the stage feeding it has to wait
+DEFAULT_QUEUE_SIZE = 8
+
+# Snapshot of one stage: items handled, seconds spent working, items per
+# second of wall time, and the current and peak depth of its input queue
+StageStats = namedtuple('StageStats', ['name', 'items', 'busy', 'rate', 'queue_depth', 'max_queue_depth'])
+
+
+class _Stage:
+    """Counters for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.queue = None
+        self.max_queue_depth = 0
+
+    def put_done(self):
+        """Note the depth of this stage's input queue after a put"""
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def snapshot(self, elapsed):
+        depth = self.queue.qsize() if self.queue else 0
+        rate = self.items / elapsed if elapsed else 0.0
+        return StageStats(self.name, self.items, self.busy, rate, depth, self.max_queue_depth)
+
+
+def _read_chunk(rows, size):
+    """Pull up to size rows from an iterator (runs on the reader thread)"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+def _write_chunk(items, fsync_files):
+    """Write rendered files, returning the exception (or None) for each (runs on a writer thread)"""
+    results = []
+    for record, path, data in items:
+        try:
+            write_file_atomic(path, data, fsync_files)
+        except Exception as e:
+            results.append(e)
+        else:
+            results.append(None)
+    return results
+
+
+class _ExportFile:
+    """A single-file export appended to a chunk at a time under a temporary name
+
+    Methods run on the writer thread. As with write_records_file, the file
+    is renamed into place at the end, and after a failure nothing more is
+    written and the temporary file is removed.
+    """
+
+    def __init__(self, path, exporter, fsync):
+        self.path = path
+        self.temp_path = temp_path_for(path)
+        self.exporter = exporter
+        self.fsync = fsync
+        self.file = None
+        self.error = None
+
+    def _open(self):
+        if self.file is None:
+            self.file = open(self.temp_path, 'wb')
+            self.file.write(self.exporter.header)
+
+    def append(self, data):
+        """Append a rendered chunk, returning the exception (or None)"""
+        if self.error is None:
+            try:
+                self._open()
+                self.file.write(data)
+                metrics.count("bytes_written", len(data))
+            except OSError as e:
+                self.error = e
+                self.discard()
+        return self.error
+
+    def finish(self):
+        """Write the footer and rename the file into place, returning the exception (or None)"""
+        if self.error is None:
+            try:
+                self._open()
+                self.file.write(self.exporter.footer)
+                if self.fsync:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                self.file.close()
+                os.replace(self.temp_path, self.path)
+            except OSError as e:
+                self.error = e
+                self.discard()
+        return self.error
+
+    def discard(self):
+        """Close and remove the temporary file"""
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class ExportPipeline:
+    """Convert (line_number, token_str, name) rows and write them as .rfid files
+
+    File naming, atomic writes and skipping of repeated file names match
+    write_rfid_files. Callbacks run on the event loop thread:
+    on_row_error(line_number, token_str, message) for rows that don't
+    convert, on_converted(record) for each converted token, and
+    on_written(record, path) / on_error(record, path, exc) as writes finish.
+    With more than one writer, writes can finish out of input order.
+
+    exporter may name another paxflip_exporters format. A single-file format
+    is written to the same file as write_export by one writer, in input
+    order. Its tokens are passed to on_written only once the file has been
+    renamed into place; if it can't be written, on_error(None, path, exc)
+    is called once instead and the result counts it as one failure.
+
+    stats() and cancel() may be called from any thread while run() is going.
+    """
+
+    def __init__(self, output_dir, name_prefix=DEFAULT_TOKEN_NAME, writers=DEFAULT_WRITERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, chunk_size=CHUNK_SIZE, fsync_files=False,
+                 on_row_error=None, on_converted=None, on_written=None, on_error=None, exporter=None):
+        self.output_dir = output_dir
+        self.name_prefix = name_prefix
+        self.exporter = get_exporter(exporter) if exporter is None or isinstance(exporter, str) else exporter
+        # Chunks of a single-file format have to be appended in order
+        self.path = None if self.exporter.one_file_per_record else export_path(output_dir, self.exporter)
+        self.writers = max(1, writers) if self.path is None else 1
+        self.queue_size = max(1, queue_size)
+        self.chunk_size = max(1, chunk_size)
+        self.fsync_files = fsync_files
+        self.on_row_error = on_row_error
+        self.on_converted = on_converted
+        self.on_written = on_written
+        self.on_error = on_error
+
+        self.stages = [_Stage("read"), _Stage("convert"), _Stage("write")]
+        self.started = None
+        self.ended = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop reading new rows; rows already in the queues are still written"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def stats(self):
+        """Return a StageStats snapshot for each stage, in pipeline order"""
+        end = self.ended or time.perf_counter()
+        elapsed = end - self.started if self.started else 0.0
+        return [stage.snapshot(elapsed) for stage in self.stages]
+
+    def format_stats(self):
+        """Describe the stage statistics as lines of text"""
+        lines = []
+        for stage, stats in zip(self.stages, self.stats()):
+            line = f"{stats.name:<8} {stats.items:>9} items  {stats.rate:>10,.0f}/s  busy {stats.busy:6.2f} s"
+            if stage.queue is not None:
+                line += f"  queue {stats.queue_depth}/{stats.max_queue_depth} (now/peak of {self.queue_size})"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def run(self, rows):
+        """Run the pipeline to completion in a fresh event loop, returning a BulkWriteResult"""
+        return asyncio.run(self.run_async(rows))
+
+    async def run_async(self, rows):
+        """Run the pipeline on the current event loop, returning a BulkWriteResult"""
+        read_stage, convert_stage, write_stage = self.stages
+        convert_stage.queue = asyncio.Queue(self.queue_size)
+        write_stage.queue = asyncio.Queue(self.queue_size)
+        counts = {"written": 0, "skipped": 0, "failed": 0}
+        loop = asyncio.get_running_loop()
+        rows = iter(rows)
+
+        async def read(reader_pool):
+            while not self._cancel.is_set():
+                start = time.perf_counter()
+                chunk = await loop.run_in_executor(reader_pool, _read_chunk, rows, self.chunk_size)
+                read_stage.busy += time.perf_counter() - start
+                if not chunk:
+                    break
+                read_stage.items += len(chunk)
+                await convert_stage.queue.put(chunk)
+                convert_stage.put_done()
+            await convert_stage.queue.put(None)
+
+        async def convert():
+            exporter = self.exporter
+            buffer = bytearray()
+            seen = SeenFiles()
+            while True:
+                chunk = await convert_stage.queue.get()
+                if chunk is None:
+                    break
+
+                start = time.perf_counter()
+                items = []
+                for record in convert_rows(chunk, self.name_prefix, self.on_row_error):
+                    if self.on_converted:
+                        self.on_converted(record)
+                    if self.path:
+                        items.append(record)
+                        continue
+                    filename = exporter.filename(record)
+                    if not seen.add(filename, record.decimal):
+                        counts["skipped"] += 1
+                        continue
+                    with metrics.timer("generate_content"):
+                        buffer.clear()
+                        exporter.render_into(buffer, record)
+                        data = bytes(buffer)
+                    items.append((record, os.path.join(self.output_dir, filename), data))
+                if self.path and items:
+                    with metrics.timer("generate_content"):
+                        buffer.clear()
+                        exporter.render_batch(items, buffer)
+                    items = (items, bytes(buffer))
+                convert_stage.items += len(chunk)
+                convert_stage.busy += time.perf_counter() - start
+
+                if items:
+                    await write_stage.queue.put(items)
+                    write_stage.put_done()
+
+            for _ in range(self.writers):
+                await write_stage.queue.put(None)
+
+        async def write(writer_pool):
+            while True:
+                items = await write_stage.queue.get()
+                if items is None:
+                    break
+
+                if export_file:
+                    await append(writer_pool, *items)
+                    continue
+
+                start = time.perf_counter()
+                results = await loop.run_in_executor(writer_pool, _write_chunk, items, self.fsync_files)
+                write_stage.busy += time.perf_counter() - start
+                write_stage.items += len(items)
+
+                for (record, path, data), exc in zip(items, results):
+                    if exc is None:
+                        counts["written"] += 1
+                        if self.on_written:
+                            self.on_written(record, path)
+                    else:
+                        counts["failed"] += 1
+                        if self.on_error:
+                            self.on_error(record, path, exc)
+
+        async def append(writer_pool, records, data):
+            start = time.perf_counter()
+            exc = await loop.run_in_executor(writer_pool, export_file.append, data)
+            write_stage.busy += time.perf_counter() - start
+            write_stage.items += len(records)
+            if exc is None:
+                # Only reported written once the file is renamed into place
+                appended.append(records if self.on_written else len(records))
+
+        appended = []
+        export_file = _ExportFile(self.path, self.exporter, self.fsync_files) if self.path else None
+        self.started = time.perf_counter()
+        self.ended = None
+        with ThreadPoolExecutor(max_workers=1) as reader_pool, \
+                ThreadPoolExecutor(max_workers=self.writers) as writer_pool:
+            tasks = [asyncio.ensure_future(read(reader_pool)), asyncio.ensure_future(convert())]
+            tasks.extend(asyncio.ensure_future(write(writer_pool)) for _ in range(self.writers))
+            try:
+                await asyncio.gather(*tasks)
+                if export_file:
+                    await loop.run_in_executor(writer_pool, export_file.finish)
+            except BaseException:
+                # One stage failed: stop the others rather than leave them waiting on a queue
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if export_file:
+                    # Queued behind any append still running on the one writer thread
+                    await loop.run_in_executor(writer_pool, export_file.discard)
+                raise
+            finally:
+                self.ended = time.perf_counter()
+
+        if export_file and export_file.error:
+            if self.on_error:
+                self.on_error(None, self.path, export_file.error)
+            return BulkWriteResult(0, 0, 1)
+
+        for records in appended:
+            if self.on_written:
+                counts["written"] += len(records)
+                for record in records:
+                    self.on_written(record, self.path)
+            else:
+                counts["written"] += records
+
+        if counts["written"]:
+            fsync_directory(self.output_dir)
+
+        return BulkWriteResult(counts["written"], counts["skipped"], counts["failed"])
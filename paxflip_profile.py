@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Profiling
+
+Profiles a batch run or a GUI session with nothing beyond the standard
+library, so a site reporting that PaxFlip is sluggish can send back a
+profile without installing any tools. Three files are written next to the
+given base path:
+
+    BASE.pstats     cProfile statistics (python -m pstats BASE.pstats, snakeviz, ...)
+    BASE.collapsed  sampled stacks, one "frame;frame;frame count" line each,
+                    for flamegraph.pl, speedscope or inferno
+    BASE.txt        a readable summary of the slowest functions
+
+A stack sampler always runs alongside cProfile, because cProfile only sees
+the thread that started it while the sampler sees every thread (such as
+the export writer pool). With sampler_only, cProfile is skipped for lower
+overhead and the .pstats file is built from the samples instead.
+
+Profiling can cover the whole run or just one named phase, marked in the
+code with phase(name) or start_phase(name)/stop_phase(name):
+
+    run       the whole process
+    startup   building the GUI window, up to the first idle
+    export    converting and writing a batch
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+# Profiled phases
+RUN = "run"
+STARTUP = "startup"
+EXPORT = "export"
+PHASES = (RUN, STARTUP, EXPORT)
+
+# Seconds between stack samples
+DEFAULT_INTERVAL = 0.005
+
+# Functions shown in the text summary
+SUMMARY_LINES = 40
+
+# Innermost frames of a thread that is only waiting; left out of the collapsed stacks
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("base_events.py", "_run_once"),
+    ("thread.py", "_worker"),
+    ("__init__.py", "mainloop"),
+}
+
+# Extensions stripped from the base path, so "--profile slow.pstats" works too
+OUTPUT_EXTENSIONS = (".pstats", ".prof", ".collapsed", ".txt")
+
+
+def _frame_key(code):
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _frame_label(code):
+    # Semicolons separate frames in the collapsed format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackSampler:
+    """Sample the Python stack of every thread on a background thread
+
+    Stacks are counted as (thread name, tuple of code objects from the
+    outermost frame in). Sampling can be started and stopped repeatedly and
+    the counts accumulate.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, include_idle=False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.ticks = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def period(self):
+        """Average seconds actually covered by one sample"""
+        return self.elapsed / self.ticks if self.ticks else self.interval
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="PaxFlipStackSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not self.include_idle and (os.path.basename(frame.f_code.co_filename),
+                                              frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                self.stacks[(names.get(ident, f"thread-{ident}"), tuple(codes))] += 1
+
+            now = time.perf_counter()
+            self.ticks += 1
+            self.elapsed += now - last
+            last = now
+
+    def collapsed(self):
+        """Return the samples as collapsed stack lines, heaviest first"""
+        merged = Counter()
+        for (thread_name, codes), count in self.stacks.items():
+            merged[";".join([thread_name.replace(";", ",")] + [_frame_label(code) for code in codes])] += count
+        return [f"{stack} {count}" for stack, count in merged.most_common()]
+
+    def stats(self):
+        """Build a pstats-compatible stats dict from the samples
+
+        Times are sample counts scaled by the sampling period, and call
+        counts are sample counts, so they are estimates rather than the
+        exact figures cProfile gives.
+        """
+        period = self.period
+        entries = {}
+        callers = {}
+
+        def entry(key):
+            if key not in entries:
+                entries[key] = [0, 0, 0.0, 0.0]
+                callers[key] = {}
+            return entries[key]
+
+        for (_, codes), count in self.stacks.items():
+            keys = [_frame_key(code) for code in codes]
+            for key in set(keys):
+                totals = entry(key)
+                totals[0] += count
+                totals[1] += count
+                totals[3] += count * period
+            entry(keys[-1])[2] += count * period
+
+            for caller, callee in set(zip(keys, keys[1:])):
+                edge = callers[callee].setdefault(caller, [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += count * period
+                if callee == keys[-1]:
+                    edge[2] += count * period
+
+        return {key: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers[key].items()})
+                for key, (cc, nc, tt, ct) in entries.items()}
+
+
+class Profiler:
+    """cProfile plus a stack sampler for the whole run or one named phase
+
+    path is the base name for the output files. The profile only records
+    while the selected phase (RUN by default) is active; a phase that runs
+    several times, such as a number of exports in one GUI session, is
+    accumulated. cProfile records the thread the phase was started on, so
+    start and stop a phase on the same thread.
+    """
+
+    def __init__(self, path, phase=RUN, sampler_only=False, interval=DEFAULT_INTERVAL):
+        if phase not in PHASES:
+            raise ValueError(f"Unknown profile phase '{phase}' (choose from {', '.join(PHASES)})")
+        base, extension = os.path.splitext(path)
+        self.base = base if extension.lower() in OUTPUT_EXTENSIONS else path
+        self.phase = phase
+        self.sampler_only = sampler_only
+        self.sampler = StackSampler(interval)
+        self.profile = None
+        if not sampler_only:
+            # The profilers are imported on use, so importing this module stays cheap
+            import cProfile
+            self.profile = cProfile.Profile()
+        self.recorded = 0.0
+        self.sessions = 0
+        self._depth = 0
+        self._started = None
+        self._lock = threading.Lock()
+
+    def install(self):
+        """Make this the profiler that phase() and start_phase() report to"""
+        global _active
+        _active = self
+        return self
+
+    def start(self):
+        with self._lock:
+            self._depth += 1
+            if self._depth > 1:
+                return
+            self.sessions += 1
+            self._started = time.perf_counter()
+            self.sampler.start()
+            if self.profile:
+                self.profile.enable()
+
+    def stop(self):
+        with self._lock:
+            if not self._depth:
+                return
+            self._depth -= 1
+            if self._depth:
+                return
+            if self.profile:
+                self.profile.disable()
+            self.sampler.stop()
+            self.recorded += time.perf_counter() - self._started
+
+    @property
+    def paths(self):
+        """The (pstats, collapsed, summary) files written by save()"""
+        return self.base + ".pstats", self.base + ".collapsed", self.base + ".txt"
+
+    def save(self):
+        """Stop recording and write the output files, returning their paths (none if the phase never ran)"""
+        while self._depth:
+            self.stop()
+        if not self.sessions:
+            return []
+
+        stats_path, collapsed_path, summary_path = self.paths
+        directory = os.path.dirname(os.path.abspath(stats_path))
+        os.makedirs(directory, exist_ok=True)
+
+        if self.profile:
+            self.profile.dump_stats(stats_path)
+        else:
+            import marshal
+            with open(stats_path, 'wb') as f:
+                marshal.dump(self.sampler.stats(), f)
+
+        with open(collapsed_path, 'w', encoding='utf-8') as f:
+            for line in self.sampler.collapsed():
+                f.write(line + "\n")
+
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.format_summary(stats_path))
+        return [stats_path, collapsed_path, summary_path]
+
+    def format_summary(self, stats_path):
+        """Describe the run and its slowest functions as text"""
+        import platform
+        import pstats
+
+        out = io.StringIO()
+        out.write("PaxFlip profile\n")
+        out.write(f"  phase:      {self.phase} ({self.sessions} session(s), {self.recorded:.3f} s recorded)\n")
+        out.write(f"  profiler:   {'sampling only' if self.sampler_only else 'cProfile + sampling'}, "
+                  f"{sum(self.sampler.stacks.values())} sample(s) every {self.sampler.period * 1000:.1f} ms\n")
+        out.write(f"  python:     {platform.python_implementation()} {platform.python_version()}\n")
+        out.write(f"  platform:   {platform.platform()}, {os.cpu_count()} CPU(s)\n")
+        out.write(f"  taken:      {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+
+        try:
+            stats = pstats.Stats(stats_path, stream=out)
+        except (TypeError, EOFError, ValueError):
+            # Nothing was recorded
+            out.write("No function calls were recorded.\n")
+            return out.getvalue()
+        stats.strip_dirs()
+        for order in ("cumulative", "tottime"):
+            out.write(f"Top {SUMMARY_LINES} by {order} time:\n")
+            stats.sort_stats(order).print_stats(SUMMARY_LINES)
+        return out.getvalue()
+
+
+# The profiler phases report to, set by Profiler.install()
+_active = None
+
+
+def phase(name):
+    """Context manager profiling its body when name is the phase being profiled"""
+    profiler = _active
+    if profiler is None or profiler.phase != name:
+        return nullcontext()
+    return _PhaseContext(profiler)
+
+
+def start_phase(name):
+    """Start profiling if name is the phase being profiled"""
+    profiler = _active
+    if profiler is not None and profiler.phase == name:
+        profiler.start()
+
+
+def stop_phase(name):
+    """Stop profiling a phase started with start_phase()"""
+    profiler = _active
+    if profiler is not None and profiler.phase == name:
+        profiler.stop()
+
+
+class _PhaseContext:
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.profiler.start()
+        return self.profiler
+
+    def __exit__(self, *exc):
+        self.profiler.stop()
+        return False
+
+
+def add_profile_arguments(parser, phases=PHASES):
+    """Add the --profile options to an argparse parser"""
+    parser.add_argument("--profile", metavar="BASE",
+                        help="profile the run and write BASE.pstats, BASE.collapsed (flame graph stacks) "
+                             "and BASE.txt")
+    parser.add_argument("--profile-phase", choices=phases, default=RUN,
+                        help="only profile this phase (default: %(default)s)")
+    parser.add_argument("--profile-sampler", action="store_true",
+                        help="use only the low-overhead sampling profiler (the .pstats times are estimates)")
+
+
+def profiler_from_args(args):
+    """Create and install a Profiler from parsed --profile options, or return None"""
+    if not args.profile:
+        return None
+    return Profiler(args.profile, args.profile_phase, args.profile_sampler).install()
+
+
+def save_profile(profiler, err=None):
+    """Write a profile and say where it went"""
+    err = err or sys.stderr
+    try:
+        paths = profiler.save()
+    except OSError as e:
+        err.write(f"Failed to write profile: {e}\n")
+        return
+    if paths:
+        err.write(f"Profile written to {', '.join(paths)}\n")
+    else:
+        err.write(f"The '{profiler.phase}' phase never ran, so no profile was written\n")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Session Results
+
+Keeps every token converted or exported in the session in a compact store
+and shows it in a virtualised grid. The grid is a ttk.Treeview holding only
+as many items as there are visible rows. Scrolling, sorting and filtering
+rewrite those rows from the store rather than inserting one item per token,
+so batches of 100k+ tokens stay instant to review.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import threading
+import tkinter as tk
+from array import array
+from tkinter import ttk
+
+from paxflip_engine import token_to_hex
+
+# Export status of each result
+CONVERTED = 0
+EXPORTED = 1
+FAILED = 2
+
+STATUS_LABELS = {
+    CONVERTED: "Converted",
+    EXPORTED: "Exported",
+    FAILED: "Failed",
+}
+
+COLUMNS = ('decimal', 'hex', 'name', 'status')
+
+
+class ResultStore:
+    """Column-oriented store of session results
+
+    Token numbers live in an array('I') and statuses in a bytearray, so each
+    result costs a few bytes plus its name. Rows are appended from the batch
+    worker thread and read from the Tk main thread. Writes take a lock, so
+    clearing from the GUI during a batch never leaves the columns out of step.
+    """
+
+    def __init__(self):
+        self.decimals = array('I')
+        self.names = []
+        self.statuses = bytearray()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def add(self, decimal, name, status=CONVERTED):
+        """Append a result and return its index"""
+        with self._lock:
+            self.decimals.append(decimal)
+            self.names.append(name)
+            # Status is appended last so len() never counts a half-added row
+            self.statuses.append(status)
+            return len(self.statuses) - 1
+
+    def set_status(self, index, status, name=None):
+        """Update the status (and optionally the name) of an existing result"""
+        with self._lock:
+            if name is not None:
+                self.names[index] = name
+            self.statuses[index] = status
+
+    def clear(self):
+        """Drop every result"""
+        with self._lock:
+            self.decimals = array('I')
+            self.names = []
+            self.statuses = bytearray()
+
+    def row(self, index):
+        """Return the display values (decimal, hex, name, status) for a result"""
+        decimal = self.decimals[index]
+        return (decimal, token_to_hex(decimal), self.names[index], STATUS_LABELS[self.statuses[index]])
+
+    def sorted_indices(self, column, reverse=False, indices=None):
+        """Return result indices ordered by column"""
+        if indices is None:
+            indices = range(len(self))
+        if column in ('decimal', 'hex'):
+            # Hex order is the same as numeric order
+            key = self.decimals.__getitem__
+        elif column == 'name':
+            key = self.names.__getitem__
+        else:
+            key = self.statuses.__getitem__
+        return array('I', sorted(indices, key=key, reverse=reverse))
+
+    def filter_indices(self, text):
+        """Return indices of results whose decimal, hex, name or status contains text"""
+        text = text.strip().lower()
+        decimals = self.decimals
+        names = self.names
+        statuses = self.statuses
+        labels = {code: label.lower() for code, label in STATUS_LABELS.items()}
+
+        matches = array('I')
+        for index in range(len(statuses)):
+            decimal = decimals[index]
+            if (text in str(decimal) or text in format(decimal, '08x')
+                    or text in names[index].lower() or text in labels[statuses[index]]):
+                matches.append(index)
+        return matches
+
+
+class VirtualResultsView(tk.Frame):
+    """Treeview grid that only ever holds the visible rows of a ResultStore"""
+
+    def __init__(self, parent, store, rows=20, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.store = store
+        self.rows = rows
+        self.offset = 0
+
+        # Visible positions map to store indices through order (None means store order)
+        self.order = None
+        self.sort_column = None
+        self.sort_reverse = False
+        self.filter_text = ""
+
+        self.tree = ttk.Treeview(self, columns=COLUMNS, show='headings', height=rows,
+                                 selectmode='browse')
+        for column, heading, width, anchor in (('decimal', 'Decimal', 120, 'e'),
+                                               ('hex', 'Hex', 100, 'center'),
+                                               ('name', 'Name', 260, 'w'),
+                                               ('status', 'Status', 100, 'w')):
+            self.tree.heading(column, text=heading, command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=width, anchor=anchor)
+
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.scrollbar.pack(side='right', fill='y')
+
+        # A fixed pool of items that get rewritten as the view scrolls
+        self.items = [self.tree.insert('', 'end', values=('', '', '', '')) for _ in range(rows)]
+        self.attached = rows
+
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.yview('scroll', -3, 'units'))
+        self.tree.bind('<Button-5>', lambda event: self.yview('scroll', 3, 'units'))
+
+        self.render()
+
+    def visible_count(self):
+        """Number of rows after filtering"""
+        return len(self.order) if self.order is not None else len(self.store)
+
+    def yview(self, *args):
+        """Scrollbar command: move the window of visible rows"""
+        count = self.visible_count()
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * count)
+        elif args[0] == 'scroll':
+            step = self.rows if args[2] == 'pages' else 1
+            self.offset += int(args[1]) * step
+        self.render()
+
+    def on_mousewheel(self, event):
+        self.yview('scroll', -3 if event.delta > 0 else 3, 'units')
+        return 'break'
+
+    def render(self):
+        """Rewrite the visible rows from the store"""
+        count = self.visible_count()
+        self.offset = max(0, min(self.offset, count - self.rows))
+        shown = min(self.rows, count - self.offset)
+
+        for i in range(shown):
+            position = self.offset + i
+            index = self.order[position] if self.order is not None else position
+            self.tree.item(self.items[i], values=self.store.row(index))
+
+        # Detach unused items so a short list has no blank rows
+        if shown != self.attached:
+            for i in range(shown, self.attached):
+                self.tree.detach(self.items[i])
+            for i in range(self.attached, shown):
+                self.tree.move(self.items[i], '', i)
+            self.attached = shown
+
+        if count:
+            self.scrollbar.set(self.offset / count, (self.offset + shown) / count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def sort_by(self, column):
+        """Sort by a column, toggling the direction on repeat clicks"""
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        self.apply()
+
+    def set_filter(self, text):
+        """Only show results matching text"""
+        self.filter_text = text
+        self.apply()
+
+    def apply(self):
+        """Recompute the filtered and sorted order, then redraw from the top"""
+        indices = self.store.filter_indices(self.filter_text) if self.filter_text.strip() else None
+        if self.sort_column:
+            self.order = self.store.sorted_indices(self.sort_column, self.sort_reverse, indices)
+        else:
+            self.order = indices
+        self.offset = 0
+        self.render()
+
+    def refresh(self):
+        """Redraw after new results arrive
+
+        An unsorted, unfiltered view picks up new rows straight away. Sorted
+        or filtered views keep their order until apply() is called.
+        """
+        self.render()
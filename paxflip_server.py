@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Local Conversion Server
+
+Serves token conversion and .rfid rendering over HTTP/JSON so job
+management tools can use PaxFlip without shelling out or driving the GUI.
+The server only ever listens on 127.0.0.1, keeps connections alive
+(HTTP/1.1) and handles each connection on its own thread.
+
+    python paxflip_server.py --port 8765
+
+    GET  /health
+    GET  /convert?token=12345678&name=Reception_Fob
+    POST /convert   {"token": "12345678", "name": "Reception_Fob"}
+    POST /batch     {"tokens": ["12345678", {"token": "0x00BC614F", "name": "Plant_Room"}]}
+    POST /archive?format=zip    (same body as /batch, streams a zip/tar archive back)
+    GET  /metrics   (Prometheus text, or ?format=json; start with --metrics to collect)
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import json
+import sys
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from paxflip_engine import (DEFAULT_TOKEN_NAME, TokenRecord, bulk_format_for_flipper, bulk_token_to_hex,
+                            default_token_name, generate_flipper_content, rfid_filename)
+from paxflip_export import ARCHIVE_FORMATS, write_archive
+from paxflip_metrics import metrics
+from paxflip_validate import InvalidToken, parse_token_variant
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Largest request body accepted (about a million tokens)
+MAX_BODY = 32 * 1024 * 1024
+
+# Host headers accepted, so web pages can't reach the server by DNS rebinding
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+ARCHIVE_CONTENT_TYPES = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+}
+
+
+def host_name(header):
+    """Return the host from a Host header without its port, keeping the brackets of an IPv6 address"""
+    header = (header or "").strip().lower()
+    if header.startswith("["):
+        # "[::1]:8080" - the colons inside the brackets are part of the address
+        address, bracket, port = header.partition("]")
+        if bracket and (not port or port.startswith(":")):
+            return address + bracket
+        return header
+    return header.split(":", 1)[0]
+
+
+class RequestError(Exception):
+    """An error reported to the client as a JSON body with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _token_items(body):
+    """Return [(token_str, name)] from a /batch or /archive request body"""
+    if not isinstance(body, dict) or not isinstance(body.get("tokens"), list):
+        raise RequestError(400, 'Body must be a JSON object with a "tokens" array.')
+
+    items = []
+    for item in body["tokens"]:
+        if isinstance(item, dict):
+            items.append((str(item.get("token", "")), str(item.get("name") or "")))
+        else:
+            items.append((str(item), ""))
+    return items
+
+
+def convert_items(items, name_prefix=DEFAULT_TOKEN_NAME):
+    """Convert [(token_str, name)] in one pass, returning (records, errors, decimals)
+
+    Valid tokens are rendered together through the bulk converters, and
+    decimals is their array('I') buffer. Each error dict gives the index of
+    the failed item in the request.
+    """
+    decimals = array('I')
+    names = []
+    errors = []
+    for index, (token_str, name) in enumerate(items):
+        try:
+            token_decimal, kind = parse_token_variant(token_str)
+        except InvalidToken as e:
+            errors.append({"index": index, "token": token_str, "code": e.code, "error": str(e)})
+            continue
+        decimals.append(token_decimal)
+        names.append(name or default_token_name(token_decimal, name_prefix))
+
+    records = [TokenRecord(name, decimal, hex_value)
+               for name, decimal, hex_value in zip(names, decimals, bulk_token_to_hex(decimals))]
+    return records, errors, decimals
+
+
+def render_results(records, decimals, include_content=True):
+    """Return the JSON result objects for converted records"""
+    results = []
+    for record, flipper_data in zip(records, bulk_format_for_flipper(decimals)):
+        result = {
+            "decimal": record.decimal,
+            "hex": record.hex,
+            "name": record.name,
+            "flipper_data": flipper_data,
+            "filename": rfid_filename(record.name, record.decimal),
+        }
+        if include_content:
+            result["content"] = generate_flipper_content(record.name, record.hex)
+        results.append(result)
+    return results
+
+
+class _ChunkedWriter:
+    """Write-only file object sending HTTP/1.1 chunked transfer encoding"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        if data:
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(data), bytes(data)))
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def close(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class PaxFlipRequestHandler(BaseHTTPRequestHandler):
+    """JSON request handler for the conversion endpoints"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "PaxFlip"
+    # Small JSON replies shouldn't wait on Nagle's algorithm
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        with metrics.timer("server_request"):
+            self._handle("GET")
+
+    def do_POST(self):
+        with metrics.timer("server_request"):
+            self._handle("POST")
+
+    def _handle(self, method):
+        self._body_read = False
+        try:
+            if host_name(self.headers.get("Host")) not in LOCAL_HOSTS:
+                raise RequestError(403, "Only local requests are served.")
+
+            url = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            route = (method, url.path.rstrip("/") or "/")
+
+            if route == ("GET", "/health"):
+                self._send_json(200, {"status": "ok"})
+            elif route == ("GET", "/metrics"):
+                self._metrics(query)
+            elif route == ("GET", "/convert"):
+                self._convert_one(query.get("token", ""), query.get("name", ""), query)
+            elif route == ("POST", "/convert"):
+                body = self._read_json()
+                if not isinstance(body, dict):
+                    raise RequestError(400, 'Body must be a JSON object with a "token".')
+                self._convert_one(str(body.get("token", "")), str(body.get("name") or ""), body)
+            elif route == ("POST", "/batch"):
+                self._batch(self._read_json(), query)
+            elif route == ("POST", "/archive"):
+                self._archive(self._read_json(), query)
+            elif url.path.rstrip("/") in ("/health", "/metrics", "/convert", "/batch", "/archive"):
+                raise RequestError(405, f"{method} is not supported here.")
+            else:
+                raise RequestError(404, "Not found.")
+        except RequestError as e:
+            self._close_if_body_unread()
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            self.log_error("Request failed: %r", e)
+            self._close_if_body_unread()
+            self._send_json(500, {"error": "Internal server error."})
+
+    def _close_if_body_unread(self):
+        """Don't reuse a connection whose request body was never read
+
+        Left in the stream, the body would be parsed as the next request.
+        """
+        if not self._body_read and ("Content-Length" in self.headers or "Transfer-Encoding" in self.headers):
+            self.close_connection = True
+
+    def _metrics(self, query):
+        if query.get("format") == "json":
+            self._send_json(200, metrics.snapshot())
+            return
+        data = metrics.to_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise RequestError(411, "Content-Length is required.")
+        if length < 0:
+            raise RequestError(400, "Content-Length can't be negative.")
+        if length > MAX_BODY:
+            raise RequestError(413, f"Request body is larger than {MAX_BODY} bytes.")
+        data = self.rfile.read(length)
+        self._body_read = True
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            raise RequestError(400, f"Invalid JSON: {e}")
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _convert_one(self, token_str, name, options):
+        prefix = options.get("name_prefix") or DEFAULT_TOKEN_NAME
+        records, errors, decimals = convert_items([(token_str, name)], prefix)
+        if errors:
+            raise RequestError(400, errors[0]["error"])
+        self._send_json(200, render_results(records, decimals)[0])
+
+    def _batch(self, body, query):
+        prefix = body.get("name_prefix") if isinstance(body, dict) else None
+        records, errors, decimals = convert_items(_token_items(body), prefix or DEFAULT_TOKEN_NAME)
+        include_content = str(query.get("content", body.get("content", True))).lower() not in ("0", "false", "no")
+        self._send_json(200, {"results": render_results(records, decimals, include_content), "errors": errors})
+
+    def _archive(self, body, query):
+        archive_format = query.get("format", "zip")
+        if archive_format not in ARCHIVE_CONTENT_TYPES:
+            raise RequestError(400, f"Unsupported archive format {archive_format!r}.")
+        prefix = body.get("name_prefix") if isinstance(body, dict) else None
+        records, errors, decimals = convert_items(_token_items(body), prefix or DEFAULT_TOKEN_NAME)
+        if errors and not records:
+            raise RequestError(400, "No valid tokens: " + "; ".join(error["error"] for error in errors[:5]))
+
+        extension = next(suffix for suffix, value in ARCHIVE_FORMATS.items() if value == archive_format)
+        self.send_response(200)
+        self.send_header("Content-Type", ARCHIVE_CONTENT_TYPES[archive_format])
+        self.send_header("Content-Disposition", f'attachment; filename="paxflip{extension}"')
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-PaxFlip-Errors", str(len(errors)))
+        self.end_headers()
+
+        writer = _ChunkedWriter(self.wfile)
+        try:
+            write_archive(writer, records, archive_format)
+        except Exception as e:
+            # Headers are already sent; dropping the connection tells the client the archive is incomplete
+            self.log_error("Archive stream failed: %r", e)
+            self.close_connection = True
+            return
+        writer.close()
+
+
+class PaxFlipServer(ThreadingHTTPServer):
+    """Threaded HTTP server bound to the loopback interface"""
+
+    daemon_threads = True
+
+    def __init__(self, port=DEFAULT_PORT, verbose=False):
+        self.verbose = verbose
+        super().__init__((HOST, port), PaxFlipRequestHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def main(argv=None):
+    """Run the local conversion server"""
+    parser = argparse.ArgumentParser(description="Serve PaxFlip token conversion on localhost.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    parser.add_argument("--metrics", action="store_true", help="collect timings and counters for GET /metrics")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+
+    server = PaxFlipServer(args.port, args.verbose)
+    sys.stderr.write(f"PaxFlip server listening on http://{HOST}:{server.port}\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
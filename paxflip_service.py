@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Net2 Service Control
+
+Queries, stops and starts the Paxton Net2ClientSvc service away from the
+Tk main thread. All service work goes through a ServiceBackend so the GUI
+flow can be exercised on machines without Windows by selecting the fake
+backend (set PAXFLIP_SERVICE_BACKEND=fake).
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from paxflip_metrics import metrics
+
+SERVICE_NAME = "Net2ClientSvc"
+
+# Service states reported by a backend
+RUNNING = "RUNNING"
+STOPPED = "STOPPED"
+PENDING = "PENDING"
+NOT_FOUND = "NOT_FOUND"
+UNKNOWN = "UNKNOWN"
+
+# Worker actions
+QUERY = "query"
+STOP = "stop"
+START = "start"
+
+# Seconds to wait for sc/net before giving up
+COMMAND_TIMEOUT = 120
+
+# Monitor polling: fast right after a change, backing off to slow when stable
+FAST_POLL_INTERVAL = 1.0
+SLOW_POLL_INTERVAL = 60.0
+
+# Outcome of one worker action, with the service state observed afterwards
+ServiceResult = namedtuple('ServiceResult', ['action', 'ok', 'state', 'message'])
+
+
+class ServiceError(Exception):
+    """Raised when a service query or control action fails"""
+
+
+class ServiceBackend:
+    """Interface for querying and controlling the Net2 service"""
+
+    def query(self):
+        """Return the current service state (RUNNING, STOPPED, PENDING or NOT_FOUND)"""
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop the service, raising ServiceError on failure"""
+        raise NotImplementedError
+
+    def start(self):
+        """Start the service, raising ServiceError on failure"""
+        raise NotImplementedError
+
+
+class WindowsServiceBackend(ServiceBackend):
+    """Control the service with sc.exe and net.exe"""
+
+    def __init__(self, service_name=SERVICE_NAME):
+        self.service_name = service_name
+
+    def _run(self, args):
+        # Imported here so the GUI never pays for subprocess on the main thread
+        import subprocess
+
+        try:
+            with metrics.timer(f"service_{args[0]}_{args[1]}"):
+                return subprocess.run(args, capture_output=True, text=True, shell=True,
+                                      timeout=COMMAND_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            metrics.count("service_timeouts")
+            raise ServiceError(f"'{' '.join(args)}' timed out after {COMMAND_TIMEOUT} seconds")
+        except OSError as e:
+            raise ServiceError(str(e))
+
+    def query(self):
+        result = self._run(['sc', 'query', self.service_name])
+        if result.returncode != 0:
+            return NOT_FOUND
+        if 'PENDING' in result.stdout:
+            return PENDING
+        return RUNNING if 'RUNNING' in result.stdout else STOPPED
+
+    def stop(self):
+        result = self._run(['net', 'stop', self.service_name])
+        if result.returncode != 0:
+            raise ServiceError(result.stderr.strip() or result.stdout.strip())
+
+    def start(self):
+        result = self._run(['net', 'start', self.service_name])
+        if result.returncode != 0:
+            raise ServiceError(result.stderr.strip() or result.stdout.strip())
+
+
+class FakeServiceBackend(ServiceBackend):
+    """In-memory service for testing the GUI flow without Windows"""
+
+    def __init__(self, state=RUNNING, delay=0.0, fail=False):
+        self.state = state
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _act(self, action, new_state):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(action)
+            if self.fail:
+                raise ServiceError(f"Fake {action} failure")
+            if self.state == NOT_FOUND:
+                raise ServiceError("The service name is invalid.")
+            self.state = new_state
+
+    def query(self):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(QUERY)
+            return self.state
+
+    def stop(self):
+        self._act(STOP, STOPPED)
+
+    def start(self):
+        self._act(START, RUNNING)
+
+
+BACKENDS = {
+    "windows": WindowsServiceBackend,
+    "fake": FakeServiceBackend,
+}
+
+
+def create_backend(name=None):
+    """Create the service backend named by name or $PAXFLIP_SERVICE_BACKEND"""
+    name = name or os.environ.get("PAXFLIP_SERVICE_BACKEND", "windows")
+    try:
+        return BACKENDS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown service backend '{name}' (choose from {', '.join(BACKENDS)})")
+
+
+class ServiceWorker:
+    """Run service queries and control actions on a background thread
+
+    Actions are queued with submit() and performed one at a time. Every
+    action produces a ServiceResult on the results queue, which the GUI
+    drains from the Tk main thread with root.after polling.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.results = queue.Queue()
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="Net2ServiceWorker", daemon=True)
+        self._thread.start()
+
+    def submit(self, action):
+        """Queue a QUERY, STOP or START action"""
+        if action not in (QUERY, STOP, START):
+            raise ValueError(f"Unknown service action '{action}'")
+        self._requests.put(action)
+
+    def drain(self):
+        """Return every result that has arrived so far without blocking"""
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def shutdown(self):
+        """Ask the worker thread to exit once queued actions are done"""
+        self._requests.put(None)
+
+    def _run(self):
+        while True:
+            action = self._requests.get()
+            if action is None:
+                return
+            self.results.put(self._perform(action))
+
+    def _query(self):
+        try:
+            return self.backend.query(), ""
+        except Exception as e:
+            return UNKNOWN, str(e)
+
+    def _perform(self, action):
+        with metrics.timer(f"service_action_{action}"):
+            return self._perform_action(action)
+
+    def _perform_action(self, action):
+        if action == QUERY:
+            state, message = self._query()
+            return ServiceResult(action, state != UNKNOWN, state, message)
+
+        try:
+            getattr(self.backend, action)()
+        except Exception as e:
+            state, _ = self._query()
+            return ServiceResult(action, False, state, str(e))
+
+        # Report the state the control action left the service in
+        state, _ = self._query()
+        return ServiceResult(action, True, state, "")
+
+
+class ServiceMonitor(ServiceWorker):
+    """Service worker that also keeps the service status fresh in the background
+
+    Between actions the worker thread polls the service itself. It polls at
+    fast_interval right after a control action or a state change, then
+    doubles the interval on every unchanged poll up to slow_interval. The
+    last known state is cached with its timestamp, and background polls
+    only post a ServiceResult when the state actually changes.
+    """
+
+    def __init__(self, backend, fast_interval=FAST_POLL_INTERVAL, slow_interval=SLOW_POLL_INTERVAL):
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.interval = fast_interval
+        self._cache = (UNKNOWN, 0.0)
+        super().__init__(backend)
+
+    @property
+    def cached_state(self):
+        """Return (state, time.time() it was last checked) without spawning anything"""
+        return self._cache
+
+    def _remember(self, state):
+        """Cache a freshly observed state, returning True if it changed"""
+        previous, _ = self._cache
+        self._cache = (state, time.time())
+        return state != previous
+
+    def _run(self):
+        while True:
+            try:
+                action = self._requests.get(timeout=self.interval)
+            except queue.Empty:
+                self._poll()
+                continue
+
+            if action is None:
+                return
+
+            result = self._perform(action)
+            changed = self._remember(result.state)
+            self.results.put(result)
+
+            # Watch closely while a stop/start settles
+            if action != QUERY or changed:
+                self.interval = self.fast_interval
+
+    def _poll(self):
+        state, _ = self._query()
+        if self._remember(state):
+            self.results.put(ServiceResult(QUERY, state != UNKNOWN, state, ""))
+            self.interval = self.fast_interval
+        else:
+            self.interval = min(self.interval * 2, self.slow_interval)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Incremental SD Card Sync
+
+Brings a Flipper SD card folder in line with a set of tokens while writing
+as little as possible. A manifest of content hashes is kept in the target
+folder. Tokens whose file is already on the card with the same content cost
+a manifest lookup instead of a write, and files PaxFlip wrote earlier for
+tokens no longer in the set can optionally be pruned.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from paxflip_engine import rfid_filename
+from paxflip_export import DEFAULT_WRITERS, fsync_directory, write_file_atomic, write_rfid_files
+from paxflip_exporters import get_exporter
+
+MANIFEST_NAME = ".paxflip_manifest.json"
+MANIFEST_VERSION = 1
+
+SyncResult = namedtuple('SyncResult', ['written', 'unchanged', 'pruned', 'failed'])
+
+
+def content_hash(data):
+    """Return the hex SHA-256 of rendered file content"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_manifest(target_dir):
+    """Load the {filename: hash} manifest from target_dir (empty if missing or unreadable)"""
+    try:
+        with open(os.path.join(target_dir, MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return dict(manifest.get("files", {}))
+
+
+def save_manifest(target_dir, files):
+    """Atomically write the manifest into target_dir"""
+    data = json.dumps({"version": MANIFEST_VERSION, "files": files}, indent=0, sort_keys=True)
+    write_file_atomic(os.path.join(target_dir, MANIFEST_NAME), data.encode('utf-8'))
+
+
+def _hash_existing_file(path):
+    """Hash a file already on the card that the manifest doesn't know about"""
+    try:
+        with open(path, 'rb') as f:
+            return content_hash(f.read())
+    except OSError:
+        return None
+
+
+def sync_rfid_files(records, target_dir, prune=False, max_workers=DEFAULT_WRITERS,
+                    on_written=None, on_error=None, on_pruned=None):
+    """Write only new or changed .rfid files for records into target_dir
+
+    The target folder is listed once up front so files deleted by hand are
+    noticed. Files on the card that are missing from the manifest (e.g. from
+    an older PaxFlip) are read and hashed once rather than rewritten. With
+    prune, files listed in the manifest but not produced by records are
+    deleted; files PaxFlip did not write are never touched.
+
+    on_written(record, path) and on_error(record, path, exc) are called in
+    input order (record is None for a failed prune). Returns a SyncResult.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    manifest = load_manifest(target_dir)
+    with os.scandir(target_dir) as entries:
+        on_card = {entry.name for entry in entries if entry.is_file()}
+
+    # Forget manifest entries whose file has gone
+    manifest_exists = MANIFEST_NAME in on_card
+    known = len(manifest)
+    manifest = {name: digest for name, digest in manifest.items() if name in on_card}
+    dirty = len(manifest) != known
+
+    wanted = set()
+    unchanged = 0
+    failed = 0
+    hashes = {}
+    exporter = get_exporter()
+
+    def changed_records():
+        nonlocal unchanged, dirty
+        for record in records:
+            filename = rfid_filename(record.name, record.decimal)
+            if filename in wanted:
+                continue
+            wanted.add(filename)
+
+            digest = content_hash(exporter.render(record))
+            if filename in on_card and filename not in manifest:
+                manifest[filename] = _hash_existing_file(os.path.join(target_dir, filename))
+                dirty = True
+
+            if manifest.get(filename) == digest:
+                unchanged += 1
+                continue
+
+            hashes[filename] = digest
+            yield record
+
+    def written(record, path):
+        filename = os.path.basename(path)
+        manifest[filename] = hashes.pop(filename)
+        if on_written:
+            on_written(record, path)
+
+    def write_failed(record, path, exc):
+        nonlocal failed
+        failed += 1
+        hashes.pop(os.path.basename(path), None)
+        if on_error:
+            on_error(record, path, exc)
+
+    result = write_rfid_files(changed_records(), target_dir, max_workers=max_workers,
+                              on_written=written, on_error=write_failed)
+
+    pruned = 0
+    if prune:
+        for filename in sorted(set(manifest) - wanted):
+            path = os.path.join(target_dir, filename)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                failed += 1
+                if on_error:
+                    on_error(None, path, e)
+                continue
+            del manifest[filename]
+            pruned += 1
+            if on_pruned:
+                on_pruned(path)
+
+    if dirty or result.written or pruned or not manifest_exists:
+        save_manifest(target_dir, {name: digest for name, digest in manifest.items() if digest})
+        fsync_directory(target_dir)
+
+    return SyncResult(result.written, unchanged, pruned, failed)
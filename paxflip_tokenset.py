@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Compact Token Sets
+
+Holds millions of token numbers in a sorted, duplicate-free array('I'),
+4 bytes per token instead of a Python int or str object each. Membership
+is a binary search, and union, difference and intersection of two sets are
+single sorted merges. NumPy is used for the heavy lifting when it is
+installed and is not required.
+
+    python paxflip_tokenset.py last_year.txt this_year.txt
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import heapq
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+
+from paxflip_engine import as_token_array
+from paxflip_ingest import FORMATS, iter_token_rows
+from paxflip_validate import validate_rows
+
+_numpy = None
+
+
+def _load_numpy():
+    """Import NumPy on first use, returning None when it isn't installed"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def _from_numpy(values):
+    return array('I', values.astype('uint32', copy=False).tobytes())
+
+
+def _as_numpy(tokens, np):
+    return np.frombuffer(tokens, dtype=np.uint32) if len(tokens) else np.empty(0, dtype=np.uint32)
+
+
+def _numpy_sorted_unique(values, np):
+    """Sort a uint32 array and drop repeats (cheaper than np.unique for this job)"""
+    # Stable sort is a merge sort, so two already-sorted runs are merged in one pass
+    values = np.sort(values, kind='stable')
+    if len(values) > 1:
+        keep = np.empty(len(values), dtype=bool)
+        keep[0] = True
+        np.not_equal(values[1:], values[:-1], out=keep[1:])
+        values = values[keep]
+    return _from_numpy(values)
+
+
+def _dedupe_sorted(values):
+    """Drop adjacent repeats from a sorted iterable of ints"""
+    return array('I', (value for value, _ in groupby(values)))
+
+
+class TokenSet:
+    """An immutable, sorted set of 32-bit token numbers backed by array('I')"""
+
+    __slots__ = ('_tokens',)
+
+    def __init__(self, tokens=()):
+        tokens = as_token_array(tokens)
+        np = _load_numpy()
+        if np is not None:
+            self._tokens = _numpy_sorted_unique(_as_numpy(tokens, np), np)
+        else:
+            self._tokens = _dedupe_sorted(sorted(tokens))
+
+    @classmethod
+    def _wrap(cls, tokens):
+        """Build a set from an array('I') that is already sorted and unique"""
+        token_set = cls.__new__(cls)
+        token_set._tokens = tokens
+        return token_set
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a set from TokenRecords"""
+        return cls(array('I', (record.decimal for record in records)))
+
+    @property
+    def tokens(self):
+        """The sorted array('I') buffer (do not modify)"""
+        return self._tokens
+
+    @property
+    def nbytes(self):
+        """Bytes used by the token buffer"""
+        return len(self._tokens) * self._tokens.itemsize
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    def __contains__(self, token):
+        tokens = self._tokens
+        index = bisect_left(tokens, token)
+        return index < len(tokens) and tokens[index] == token
+
+    def __eq__(self, other):
+        if not isinstance(other, TokenSet):
+            return NotImplemented
+        return self._tokens == other._tokens
+
+    def __repr__(self):
+        return f"<TokenSet of {len(self)} tokens>"
+
+    def union(self, other):
+        """Tokens in either set"""
+        np = _load_numpy()
+        if np is not None:
+            both = np.concatenate((_as_numpy(self._tokens, np), _as_numpy(other._tokens, np)))
+            return self._wrap(_numpy_sorted_unique(both, np))
+        return self._wrap(_dedupe_sorted(heapq.merge(self._tokens, other._tokens)))
+
+    def difference(self, other):
+        """Tokens in this set but not in other"""
+        np = _load_numpy()
+        if np is not None:
+            mine = _as_numpy(self._tokens, np)
+            theirs = _as_numpy(other._tokens, np)
+            return self._wrap(_from_numpy(mine[~self._found_in(mine, theirs, np)]))
+        return self._wrap(array('I', self._merge_select(other, keep_common=False)))
+
+    def intersection(self, other):
+        """Tokens in both sets"""
+        np = _load_numpy()
+        if np is not None:
+            mine = _as_numpy(self._tokens, np)
+            theirs = _as_numpy(other._tokens, np)
+            return self._wrap(_from_numpy(mine[self._found_in(mine, theirs, np)]))
+        return self._wrap(array('I', self._merge_select(other, keep_common=True)))
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    @staticmethod
+    def _found_in(mine, theirs, np):
+        """Boolean mask of which sorted tokens in mine are also in sorted theirs"""
+        if not len(theirs):
+            return np.zeros(len(mine), dtype=bool)
+        index = np.searchsorted(theirs, mine)
+        index[index == len(theirs)] = 0
+        return theirs[index] == mine
+
+    def _merge_select(self, other, keep_common):
+        """Walk both sorted buffers once, yielding this set's tokens that are (or aren't) in other"""
+        theirs = other._tokens
+        j = 0
+        count = len(theirs)
+        for token in self._tokens:
+            while j < count and theirs[j] < token:
+                j += 1
+            common = j < count and theirs[j] == token
+            if common == keep_common:
+                yield token
+
+    def tobytes(self):
+        """The tokens as native-endian uint32 bytes"""
+        return self._tokens.tobytes()
+
+    @classmethod
+    def frombytes(cls, data):
+        """Rebuild a set from tobytes() output"""
+        tokens = array('I')
+        tokens.frombytes(data)
+        return cls(tokens)
+
+
+def load_token_set(path, input_format=None, on_error=None):
+    """Read every valid token from a token list or Net2 export into a TokenSet
+
+    Tokens may be in any spelling paxflip_validate accepts. on_error(line_number,
+    token_str, message) is called for rows that are not valid tokens.
+    """
+    rows = validate_rows(iter_token_rows(path, input_format), on_error=on_error)
+    return TokenSet(array('I', (int(token_str) for _, token_str, _ in rows)))
+
+
+def main(argv=None):
+    """Compare the tokens in two lists from the command line"""
+    parser = argparse.ArgumentParser(
+        description="Show which tokens were added and removed between two token lists or Net2 exports.")
+    parser.add_argument("old", help="earlier token list or export")
+    parser.add_argument("new", help="later token list or export")
+    parser.add_argument("-f", "--format", choices=FORMATS,
+                        help="input format of both files (default: from the file extensions)")
+    args = parser.parse_args(argv)
+
+    def report_error(line_number, token_str, message):
+        sys.stderr.write(f"line {line_number}: {token_str!r}: {message}\n")
+
+    old = load_token_set(args.old, args.format, report_error)
+    new = load_token_set(args.new, args.format, report_error)
+
+    added = new - old
+    removed = old - new
+    for token in removed:
+        print(f"-{token}")
+    for token in added:
+        print(f"+{token}")
+
+    sys.stderr.write(f"{len(old)} -> {len(new)} tokens: {len(added)} added, {len(removed)} removed\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
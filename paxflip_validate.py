@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Batch Validation
+
+Checks a whole token batch in one pass instead of stopping at the first bad
+entry. Tokens may be given in decimal or in hex as they appear on site
+paperwork and Flipper screens (0x00BC614E, 00BC614Eh, 00 BC 61 4E), with
+stray whitespace, leading zeros or grouped thousands. Every problem is
+recorded with its line number in a JSON lines report and the valid rows
+carry straight on to conversion.
+
+    python paxflip_validate.py tokens.txt --report errors.jsonl
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+
+from paxflip_engine import DECIMAL_GROUPED_PATTERN, HEX_BYTES_PATTERN, MAX_TOKEN, TokenError
+from paxflip_ingest import FORMATS, iter_token_rows
+
+# Error codes used in the report
+EMPTY = "empty"
+INVALID = "invalid"
+OUT_OF_RANGE = "out_of_range"
+FAILED = "failed"
+
+# Token spellings, tried in order
+HEX_PREFIXED = re.compile(r'^0[xX]([0-9A-Fa-f]+)$')
+HEX_SUFFIXED = re.compile(r'^([0-9A-Fa-f]+)[hH]$')
+HEX_BYTES = re.compile(rf'^{HEX_BYTES_PATTERN}$')
+HEX_LETTERS = re.compile(r'^(?=.*[A-Fa-f])(?:00)?[0-9A-Fa-f]{8}$')
+DECIMAL_GROUPED = re.compile(rf'^{DECIMAL_GROUPED_PATTERN}$')
+DECIMAL = re.compile(r'^\d+$')
+
+
+class InvalidToken(TokenError):
+    """A token that failed validation, with a report error code"""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def parse_token_variant(token_str):
+    """Parse a decimal or hex token in any accepted spelling, returning (decimal, kind)
+
+    kind is "decimal" or "hex". Eight digits on their own are always read
+    as decimal, as the GUI does; hex needs a prefix, suffix or byte spacing,
+    or must be a full 8-digit hex value with an A-F digit (so a typo such as
+    "bad" is not taken for 0xBAD). Raises InvalidToken.
+    """
+    token = token_str.strip()
+    if not token:
+        raise InvalidToken("Please enter a token number.", EMPTY)
+
+    kind = "hex"
+    match = HEX_PREFIXED.match(token) or HEX_SUFFIXED.match(token)
+    if match:
+        digits = match.group(1)
+    elif HEX_BYTES.match(token) or HEX_LETTERS.match(token):
+        digits = re.sub(r'[ :\-]', '', token)
+    elif DECIMAL.match(token) or DECIMAL_GROUPED.match(token):
+        kind = "decimal"
+        digits = re.sub(r'[ ,]', '', token)
+    else:
+        raise InvalidToken("Not a decimal or hex token number.", INVALID)
+
+    token_decimal = int(digits, 16 if kind == "hex" else 10)
+    if token_decimal > MAX_TOKEN:
+        raise InvalidToken("Token number is too large (exceeds 32-bit limit).", OUT_OF_RANGE)
+    return token_decimal, kind
+
+
+class ValidationReport:
+    """Counts valid and invalid rows and streams each error to a JSON lines file
+
+    error(line_number, token_str, message) matches the on_error callbacks
+    used across PaxFlip, so the report can also collect conversion and
+    write failures from later stages. error may be called from more than
+    one thread, such as the export pipeline's reader and its event loop.
+    """
+
+    def __init__(self, stream=None, source=None):
+        self.stream = stream
+        self.source = source
+        self.valid = 0
+        self.kinds = {}
+        self.errors = 0
+        self.codes = {}
+        self._lock = threading.Lock()
+
+    def accept(self, kind, count=1):
+        self.valid += count
+        self.kinds[kind] = self.kinds.get(kind, 0) + count
+
+    def error(self, line_number, token_str, message, code=FAILED, name=None):
+        with self._lock:
+            self.errors += 1
+            self.codes[code] = self.codes.get(code, 0) + 1
+            if self.stream:
+                entry = {"line": line_number, "token": token_str, "code": code, "error": message}
+                if name:
+                    entry["name"] = name
+                if self.source:
+                    entry["source"] = self.source
+                self.stream.write(json.dumps(entry) + "\n")
+
+    def summary(self):
+        """Return the totals as a dict"""
+        return {"source": self.source, "rows": self.valid + self.errors, "valid": self.valid,
+                "errors": self.errors, "kinds": dict(self.kinds), "codes": dict(self.codes)}
+
+    def format_summary(self):
+        """Describe the totals in one line of text"""
+        line = f"{self.valid + self.errors} row(s): {self.valid} valid, {self.errors} invalid"
+        details = [f"{count} {kind}" for kind, count in sorted(self.kinds.items())]
+        details += [f"{count} {code}" for code, count in sorted(self.codes.items())]
+        if details:
+            line += f" ({', '.join(details)})"
+        return line
+
+
+def validate_rows(rows, report=None, on_error=None):
+    """Yield each valid (line_number, token_str, name) row with the token as plain decimal
+
+    Invalid rows are recorded in report and passed to on_error(line_number,
+    token_str, message) without stopping the batch, so the output can feed
+    convert_rows, the export pipeline or the sharded exporter directly.
+    """
+    for line_number, token_str, name in rows:
+        try:
+            token_decimal, kind = parse_token_variant(token_str)
+        except InvalidToken as e:
+            if report:
+                report.error(line_number, token_str, str(e), e.code, name)
+            if on_error:
+                on_error(line_number, token_str, str(e))
+            continue
+
+        if report:
+            report.accept(kind)
+        yield line_number, str(token_decimal), name
+
+
+def main(argv=None):
+    """Validate a token list or Net2 export from the command line"""
+    parser = argparse.ArgumentParser(description="Check every token in a token list or Net2 export.")
+    parser.add_argument("input", help="token list or Net2 CSV/XML export")
+    parser.add_argument("-f", "--format", choices=FORMATS,
+                        help="input format (default: from the file extension)")
+    parser.add_argument("--report", help="write one JSON line per invalid row here (default: stdout)")
+    parser.add_argument("--summary", help="also write the totals as JSON to this file")
+    args = parser.parse_args(argv)
+
+    out = open(args.report, 'w', encoding='utf-8') if args.report else sys.stdout
+    try:
+        report = ValidationReport(out, source=args.input)
+        for _ in validate_rows(iter_token_rows(args.input, args.format), report):
+            pass
+    finally:
+        if args.report:
+            out.close()
+
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(report.summary(), f, indent=2)
+    sys.stderr.write(report.format_summary() + "\n")
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
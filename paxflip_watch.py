@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+PaxFlip - Watch Folder
+
+Runs headless, watching an input folder (such as an office share that job
+sheets are dropped into) for new token list files and for lines appended
+to existing ones. Only rows that haven't been seen before are converted:
+every file has a checkpoint holding the byte offset and line number
+processed so far and a checksum of the content up to that offset. After a
+crash or restart the watcher carries on from the checkpoints, and a file
+that was replaced or truncated is noticed and processed again from the
+start.
+
+    python paxflip_watch.py \\\\server\\jobs -o D:\\flipper\\rfid
+
+Changes are picked up with inotify on Linux, and by polling file sizes and
+modification times everywhere else. Network shares don't report changes
+made by other machines to inotify, so the folder is also rescanned every
+so often regardless.
+
+Intercom Services London
+GitHub: https://github.com/ISLKey/PaxFlip
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+
+from paxflip_engine import DEFAULT_TOKEN_NAME, convert_rows, iter_token_lines
+from paxflip_export import DEFAULT_WRITERS, write_file_atomic, write_rfid_files
+from paxflip_validate import validate_rows
+
+# Checkpoints are kept in the output folder, beside the files they describe
+CHECKPOINT_NAME = ".paxflip_watch.json"
+CHECKPOINT_VERSION = 1
+
+DEFAULT_PATTERN = "*.txt"
+
+# Rows converted and written between checkpoint saves
+BATCH_ROWS = 1000
+
+# Bytes from the start of a file, and from just before the checkpoint offset,
+# covered by the checksum, so verifying a checkpoint never reads a whole file
+FINGERPRINT_BYTES = 4096
+
+# Seconds a file must be left alone before a last line without a newline is processed
+DEFAULT_SETTLE = 2.0
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_RESCAN_INTERVAL = 30.0
+
+# Longest the watch loop blocks, so stop() is noticed promptly
+MAX_WAIT = 1.0
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event: wd, mask, cookie, len, then len bytes of name
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Report changed file names in a folder using Linux inotify through ctypes"""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed: {os.strerror(errno)}")
+
+    def changes(self, timeout):
+        """Wait up to timeout seconds, returning the set of changed names (None if events were lost)"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                start = offset + INOTIFY_EVENT.size
+                name = data[start:start + length].rstrip(b"\0")
+                offset = start + length
+                if mask & IN_Q_OVERFLOW:
+                    names = None
+                elif name and names is not None:
+                    names.add(os.fsdecode(name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Report changed file names in a folder by comparing sizes and modification times"""
+
+    def __init__(self, directory, interval=DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._seen = self._snapshot()
+        self._next_poll = time.monotonic() + interval
+
+    def _snapshot(self):
+        seen = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            seen[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            # The share is unavailable; report nothing until it comes back
+            return self._seen
+        return seen
+
+    def changes(self, timeout):
+        """Wait up to timeout seconds, returning the set of names changed since the last poll"""
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_poll = time.monotonic() + self.interval
+
+        previous, self._seen = self._seen, self._snapshot()
+        changed = {name for name, state in self._seen.items() if previous.get(name) != state}
+        return changed | (previous.keys() - self._seen.keys())
+
+    def close(self):
+        pass
+
+
+def create_watcher(directory, poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True):
+    """Return an InotifyWatcher where the platform has one, otherwise a PollingWatcher"""
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            # No usable libc, or the inotify watch limit has been reached
+            pass
+    return PollingWatcher(directory, poll_interval)
+
+
+def fingerprint(f, offset):
+    """Return the checksum of a file's content up to offset
+
+    Only the first and last FINGERPRINT_BYTES before offset are read, which
+    is enough to tell an appended file from a replaced or rewritten one.
+    """
+    digest = hashlib.sha256()
+    f.seek(0)
+    digest.update(f.read(min(offset, FINGERPRINT_BYTES)))
+    if offset > FINGERPRINT_BYTES:
+        start = max(FINGERPRINT_BYTES, offset - FINGERPRINT_BYTES)
+        f.seek(start)
+        digest.update(f.read(offset - start))
+    return digest.hexdigest()
+
+
+def load_checkpoints(path):
+    """Load the {file name: checkpoint} map from path (empty if missing or unreadable)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get("version") != CHECKPOINT_VERSION:
+        return {}
+    return dict(state.get("files", {}))
+
+
+def save_checkpoints(path, files):
+    """Atomically and durably write the checkpoints to path"""
+    data = json.dumps({"version": CHECKPOINT_VERSION, "files": files}, indent=0, sort_keys=True)
+    write_file_atomic(path, data.encode('utf-8'), fsync=True)
+
+
+class FolderWatcher:
+    """Convert new rows of token lists in input_dir into .rfid files in output_dir
+
+    Rows are processed BATCH_ROWS at a time and the file's checkpoint is
+    saved after each batch has been written, so a crash repeats at most one
+    batch, whose files are rewritten with identical content. A batch with a
+    failed write is not checkpointed and is retried on the next change or
+    rescan. Only complete lines are read while a file is being written; a
+    last line without a newline is processed once the file has been left
+    alone for settle seconds.
+
+    on_written(record, path) and on_error(file_name, line_number, token_str,
+    message) are called from the watching thread; log(message) receives
+    progress messages.
+    """
+
+    def __init__(self, input_dir, output_dir, pattern=DEFAULT_PATTERN, name_prefix=DEFAULT_TOKEN_NAME,
+                 checkpoint_path=None, workers=DEFAULT_WRITERS, fsync_files=True, settle=DEFAULT_SETTLE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, rescan_interval=DEFAULT_RESCAN_INTERVAL,
+                 use_inotify=True, on_written=None, on_error=None, log=None):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.pattern = pattern
+        self.name_prefix = name_prefix
+        self.checkpoint_path = checkpoint_path or os.path.join(output_dir, CHECKPOINT_NAME)
+        self.workers = workers
+        self.fsync_files = fsync_files
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.use_inotify = use_inotify
+        self.on_written = on_written
+        self.on_error = on_error
+        self.log = log or (lambda message: None)
+
+        self.checkpoints = load_checkpoints(self.checkpoint_path)
+        self.rows_processed = 0
+        self.files_written = 0
+        self.watcher = None
+        self._unsettled = set()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Ask run() to return"""
+        self._stop.set()
+
+    def matches(self, name):
+        return fnmatch.fnmatch(name.lower(), self.pattern.lower()) and not name.startswith(".")
+
+    def list_files(self):
+        """Return the names of matching files in the input folder"""
+        try:
+            with os.scandir(self.input_dir) as entries:
+                return sorted(entry.name for entry in entries if self.matches(entry.name) and entry.is_file())
+        except OSError as e:
+            self.log(f"Cannot list {self.input_dir}: {e}")
+            return []
+
+    def scan(self):
+        """Process every matching file once, returning the number of rows converted"""
+        names = self.list_files()
+        # Forget files that have gone, so a new file with the same name starts afresh
+        gone = [name for name in self.checkpoints if name not in names]
+        if gone:
+            for name in gone:
+                del self.checkpoints[name]
+            self._save()
+        return sum(self.process_file(name) for name in names)
+
+    def run(self):
+        """Catch up from the checkpoints, then process changes until stop() is called"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.watcher = create_watcher(self.input_dir, self.poll_interval, self.use_inotify)
+        self.log(f"Watching {self.input_dir} for {self.pattern} "
+                 f"({'inotify' if isinstance(self.watcher, InotifyWatcher) else 'polling'})")
+        try:
+            self.scan()
+            next_rescan = time.monotonic() + self.rescan_interval
+            while not self._stop.is_set():
+                wait = min(MAX_WAIT, max(0.0, next_rescan - time.monotonic()))
+                if self._unsettled:
+                    wait = min(wait, self.settle)
+                names = self.watcher.changes(wait)
+
+                if names is None or time.monotonic() >= next_rescan:
+                    self.scan()
+                    next_rescan = time.monotonic() + self.rescan_interval
+                    continue
+                for name in sorted(names | self._unsettled):
+                    if self.matches(name):
+                        self.process_file(name)
+        finally:
+            self.watcher.close()
+            self.watcher = None
+
+    def _save(self):
+        try:
+            save_checkpoints(self.checkpoint_path, self.checkpoints)
+        except OSError as e:
+            self.log(f"Failed to save checkpoints to {self.checkpoint_path}: {e}")
+
+    def _report_error(self, name, line_number, token_str, message):
+        if self.on_error:
+            self.on_error(name, line_number, token_str, message)
+
+    def process_file(self, name):
+        """Convert the rows of one file not yet processed, returning the number of rows converted"""
+        path = os.path.join(self.input_dir, name)
+        self._unsettled.discard(name)
+        try:
+            stat = os.stat(path)
+            with open(path, 'rb') as f:
+                return self._process(name, f, stat)
+        except FileNotFoundError:
+            if self.checkpoints.pop(name, None) is not None:
+                self._save()
+            return 0
+        except OSError as e:
+            # Still locked by the copy onto the share, or the share dropped; retried on the next change
+            self.log(f"Cannot read {path}: {e}")
+            return 0
+
+    def _process(self, name, f, stat):
+        checkpoint = self.checkpoints.get(name)
+        if checkpoint:
+            unchanged = stat.st_size == checkpoint["offset"] and stat.st_mtime_ns == checkpoint["mtime_ns"]
+            if unchanged:
+                return 0
+            if stat.st_size < checkpoint["offset"] or fingerprint(f, checkpoint["offset"]) != checkpoint["checksum"]:
+                self.log(f"{name} was replaced or rewritten; processing it again from the start")
+                checkpoint = None
+
+        offset, line = (checkpoint["offset"], checkpoint["lines"]) if checkpoint else (0, 0)
+        settled = time.time() - stat.st_mtime >= self.settle
+        converted = 0
+        f.seek(offset)
+        while True:
+            lines = []
+            end = offset
+            while len(lines) < BATCH_ROWS:
+                raw = f.readline()
+                if not raw:
+                    break
+                if not raw.endswith(b"\n") and not settled:
+                    # Still being written; pick it up once the file settles
+                    self._unsettled.add(name)
+                    break
+                text = raw.decode('utf-8', errors='replace')
+                if end == 0:
+                    text = text.lstrip('\ufeff')
+                lines.append(text)
+                end += len(raw)
+            if not lines:
+                break
+
+            written = self._write(name, lines, line + 1)
+            if written is None:
+                break
+            converted += written
+            offset = end
+            line += len(lines)
+            self.checkpoints[name] = {"offset": offset, "lines": line, "checksum": fingerprint(f, offset),
+                                      "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            self._save()
+            f.seek(offset)
+
+        if converted:
+            self.log(f"{name}: converted {converted} new row(s), now at line {line}")
+        return converted
+
+    def _write(self, name, lines, first_line):
+        """Convert and write one batch of lines, returning the rows converted (None if a write failed)"""
+        def row_error(line_number, token_str, message):
+            self._report_error(name, line_number, token_str, message)
+
+        def write_failed(record, path, exc):
+            self._report_error(name, None, str(record.decimal), f"Failed to save {path}: {exc}")
+
+        rows = validate_rows(iter_token_lines(lines, first_line), on_error=row_error)
+        converted = 0
+
+        def records():
+            nonlocal converted
+            for record in convert_rows(rows, self.name_prefix, row_error):
+                converted += 1
+                yield record
+
+        result = write_rfid_files(records(), self.output_dir, max_workers=self.workers,
+                                  fsync_files=self.fsync_files, on_written=self.on_written,
+                                  on_error=write_failed)
+        self.files_written += result.written
+        if result.failed:
+            self.log(f"{name}: {result.failed} file(s) failed to write; will retry from line {first_line}")
+            return None
+        self.rows_processed += converted
+        return converted
+
+
+def main(argv=None):
+    """Watch a folder from the command line"""
+    parser = argparse.ArgumentParser(description="Watch a folder and convert new token list rows to .rfid files.")
+    parser.add_argument("input_dir", help="folder that token lists are dropped into")
+    parser.add_argument("-o", "--output-dir", required=True, help="folder to write .rfid files into")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN,
+                        help="file names to watch (default: %(default)s)")
+    parser.add_argument("--name-prefix", default=DEFAULT_TOKEN_NAME,
+                        help="prefix for tokens without a name (default: %(default)s)")
+    parser.add_argument("--checkpoints",
+                        help=f"checkpoint file (default: {CHECKPOINT_NAME} in the output folder)")
+    parser.add_argument("--poll", action="store_true", help="poll file sizes and times instead of using inotify")
+    parser.add_argument("--interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="seconds between polls (default: %(default)s)")
+    parser.add_argument("--rescan", type=float, default=DEFAULT_RESCAN_INTERVAL,
+                        help="seconds between full rescans of the folder (default: %(default)s)")
+    parser.add_argument("--no-fsync", action="store_true",
+                        help="don't flush each .rfid file to disk before checkpointing (faster, less crash-safe)")
+    parser.add_argument("--once", action="store_true", help="process what is there now and exit")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report errors")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"{args.input_dir} is not a folder")
+
+    def log(message):
+        if not args.quiet:
+            sys.stderr.write(time.strftime('%H:%M:%S ') + message + "\n")
+
+    def report_error(name, line_number, token_str, message):
+        where = f"{name}:{line_number}" if line_number else name
+        sys.stderr.write(f"{where}: {token_str!r}: {message}\n")
+
+    watcher = FolderWatcher(args.input_dir, args.output_dir, args.pattern, args.name_prefix,
+                            checkpoint_path=args.checkpoints, fsync_files=not args.no_fsync,
+                            poll_interval=args.interval, rescan_interval=args.rescan,
+                            use_inotify=not args.poll, on_error=report_error, log=log)
+    if args.once:
+        os.makedirs(args.output_dir, exist_ok=True)
+        watcher.settle = 0
+        watcher.scan()
+        log(f"Converted {watcher.rows_processed} row(s)")
+        return 0
+
+    # Stop cleanly when a service manager asks
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    log(f"Stopped after converting {watcher.rows_processed} row(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
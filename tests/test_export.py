@@ -0,0 +1,75 @@
+"""
+PaxFlip - Single-file export tests
+
+A token is only reported written once the file holding it is in place, so
+the CLI output and the token ledger never list tokens from a file that was
+discarded.
+
+Run from the repository folder with: python -m pytest tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paxflip_engine import convert_rows
+from paxflip_export import BulkWriteResult, write_export
+from paxflip_pipeline import ExportPipeline
+
+ROWS = [(number, str(12345678 + number), f"User_{number}") for number in range(1, 1001)]
+
+
+class SingleFileExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.written = []
+        self.failed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def on_written(self, record, path):
+        self.written.append(record.decimal)
+
+    def on_error(self, record, path, exc):
+        self.failed.append(path)
+
+    def block_rename(self):
+        # A folder where the file should go makes the final rename fail
+        os.makedirs(os.path.join(self.folder, "paxflip_tokens.csv", "blocker"))
+
+    def test_write_export(self):
+        result = write_export(convert_rows(ROWS), self.folder, "csv", on_written=self.on_written)
+        self.assertEqual(result, BulkWriteResult(1000, 0, 0))
+        self.assertEqual(len(self.written), 1000)
+
+    def test_write_export_failed_rename(self):
+        self.block_rename()
+        result = write_export(convert_rows(ROWS), self.folder, "csv",
+                              on_written=self.on_written, on_error=self.on_error)
+        self.assertEqual(result, BulkWriteResult(0, 0, 1))
+        self.assertEqual(self.written, [])
+        self.assertEqual(len(self.failed), 1)
+
+    def test_pipeline(self):
+        pipeline = ExportPipeline(self.folder, exporter="csv", chunk_size=64, on_written=self.on_written)
+        self.assertEqual(pipeline.run(ROWS), BulkWriteResult(1000, 0, 0))
+        self.assertEqual(self.written, [12345678 + number for number in range(1, 1001)])
+
+    def test_pipeline_failed_rename(self):
+        self.block_rename()
+        pipeline = ExportPipeline(self.folder, exporter="csv", chunk_size=64,
+                                  on_written=self.on_written, on_error=self.on_error)
+        self.assertEqual(pipeline.run(ROWS), BulkWriteResult(0, 0, 1))
+        self.assertEqual(self.written, [])
+        self.assertEqual(len(self.failed), 1)
+        self.assertEqual(sorted(os.listdir(self.folder)), ["paxflip_tokens.csv"])
+
+
+if __name__ == "__main__":
+    unittest.main()
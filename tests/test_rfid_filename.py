@@ -0,0 +1,69 @@
+"""
+PaxFlip - .rfid file name tests
+
+Different tokens must never be written to the same file, even when a name
+ends in digits that another token's number also ends in.
+
+Run from the repository folder with: python -m pytest tests
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paxflip_cli
+from paxflip_engine import parse_flipper_content, rfid_filename
+
+
+class RfidFilenameTest(unittest.TestCase):
+
+    def test_token_number_is_appended(self):
+        self.assertEqual(rfid_filename("Front Door", 12345678), "Front_Door_12345678.rfid")
+
+    def test_name_already_ending_with_the_token_is_kept(self):
+        self.assertEqual(rfid_filename("Paxton_Token_12345678", 12345678), "Paxton_Token_12345678.rfid")
+        self.assertEqual(rfid_filename("Door_11", 11), "Door_11.rfid")
+
+    def test_digits_without_a_separator_are_not_the_token(self):
+        self.assertEqual(rfid_filename("Door_11", 1), "Door_11_1.rfid")
+        self.assertEqual(rfid_filename("Fob_112", 12), "Fob_112_12.rfid")
+        self.assertEqual(rfid_filename("Fob_112", 112), "Fob_112.rfid")
+
+
+class CollidingNamesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def export(self, text):
+        token_list = os.path.join(self.folder, "tokens.txt")
+        with open(token_list, 'w') as f:
+            f.write(text)
+        output_dir = os.path.join(self.folder, "out")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(paxflip_cli.main([token_list, "-o", output_dir]), 0)
+
+        tokens = {}
+        for filename in os.listdir(output_dir):
+            with open(os.path.join(output_dir, filename)) as f:
+                tokens[filename] = parse_flipper_content(f.read())[0]
+        return tokens
+
+    def test_door_pair(self):
+        self.assertEqual(self.export("1,Door_11\n11,Door\n"), {"Door_11_1.rfid": 1, "Door_11.rfid": 11})
+
+    def test_fob_pair(self):
+        self.assertEqual(self.export("12,Fob_112\n112,Fob_112\n"), {"Fob_112_12.rfid": 12, "Fob_112.rfid": 112})
+
+
+if __name__ == "__main__":
+    unittest.main()
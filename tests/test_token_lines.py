@@ -0,0 +1,144 @@
+"""
+PaxFlip - Token list parsing tests
+
+Tokens spelled with spaces or commas inside them must reach the batch and
+command line exports whole, not be cut at the first separator and the rest
+taken for the name.
+
+Run from the repository folder with: python -m pytest tests
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paxflip_cli
+from paxflip_engine import iter_token_lines
+from paxflip_jobs import BatchJob
+from paxflip_tokenset import load_token_set
+
+TOKEN_LIST = """\
+# spaced hex bytes, with and without a name
+00 BC 61 4E
+00 BC 61 4F Front_Door
+# grouped thousands
+12 345 680
+12,345,681,Reception_Fob
+12 345 682 Plant Room
+# plain tokens still split at the first separator
+12345683,Side_Gate
+12345684 Car_Park
+"""
+
+EXPECTED_FILES = [
+    "Front_Door_12345679.rfid",
+    "Paxton_Token_12345678.rfid",
+    "Paxton_Token_12345680.rfid",
+    "Car_Park_12345684.rfid",
+    "Plant_Room_12345682.rfid",
+    "Reception_Fob_12345681.rfid",
+    "Side_Gate_12345683.rfid",
+]
+
+
+class IterTokenLinesTest(unittest.TestCase):
+
+    def test_spaced_tokens_are_kept_whole(self):
+        rows = list(iter_token_lines(TOKEN_LIST.splitlines()))
+        self.assertEqual([(token, name) for _, token, name in rows], [
+            ("00 BC 61 4E", ""),
+            ("00 BC 61 4F", "Front_Door"),
+            ("12 345 680", ""),
+            ("12,345,681", "Reception_Fob"),
+            ("12 345 682", "Plant Room"),
+            ("12345683", "Side_Gate"),
+            ("12345684", "Car_Park"),
+        ])
+
+    def test_short_token_before_a_name(self):
+        self.assertEqual(list(iter_token_lines(["12 Plant Room"])), [(1, "12", "Plant Room")])
+
+
+class BatchPathTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.token_list = os.path.join(self.folder, "tokens.txt")
+        with open(self.token_list, 'w') as f:
+            f.write(TOKEN_LIST)
+        self.output_dir = os.path.join(self.folder, "out")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_cli(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return paxflip_cli.main([self.token_list, "-o", self.output_dir, *args])
+
+    def assert_exported(self):
+        self.assertEqual(sorted(os.listdir(self.output_dir)), sorted(EXPECTED_FILES))
+
+    def test_cli(self):
+        self.assertEqual(self.run_cli(), 0)
+        self.assert_exported()
+
+    def test_cli_pipeline(self):
+        self.assertEqual(self.run_cli("--pipeline"), 0)
+        self.assert_exported()
+
+    def test_cli_csv_export(self):
+        self.assertEqual(self.run_cli("--to", "csv"), 0)
+        with open(os.path.join(self.output_dir, "paxflip_tokens.csv"), newline='') as f:
+            lines = f.read().splitlines()
+        self.assertIn("Front_Door,12345679,00BC614F,00 BC 61 4F", lines)
+        self.assertIn("Reception_Fob,12345681,00BC6151,00 BC 61 51", lines)
+
+    def test_cli_csv_export_modes(self):
+        self.assertEqual(self.run_cli("--to", "csv"), 0)
+        with open(os.path.join(self.output_dir, "paxflip_tokens.csv"), 'rb') as f:
+            expected = f.read()
+
+        self.output_dir = os.path.join(self.folder, "pipeline")
+        self.assertEqual(self.run_cli("--to", "csv", "--pipeline"), 0)
+        with open(os.path.join(self.output_dir, "paxflip_tokens.csv"), 'rb') as f:
+            self.assertEqual(f.read(), expected)
+
+        archive = os.path.join(self.folder, "tokens.zip")
+        self.assertEqual(self.run_cli("--to", "csv", "--archive", archive), 0)
+        with zipfile.ZipFile(archive) as z:
+            self.assertEqual(z.namelist(), ["paxflip_tokens.csv", "manifest.csv"])
+            self.assertEqual(z.read("paxflip_tokens.csv"), expected)
+
+        self.output_dir = os.path.join(self.folder, "parts")
+        self.assertEqual(self.run_cli("--to", "csv", "-p", "2"), 0)
+        with open(os.path.join(self.output_dir, "part-0000.csv"), 'rb') as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_batch_job(self):
+        # The GUI always hands the job an existing folder
+        os.makedirs(self.output_dir)
+        job = BatchJob(self.token_list, output_dir=self.output_dir, pipeline=True)
+        job.start()
+        job.wait()
+        progress = job.progress()
+        self.assertEqual((progress.total, progress.converted, progress.failed, progress.error), (7, 7, 0, None))
+        self.assert_exported()
+
+    def test_load_token_set(self):
+        errors = []
+        tokens = load_token_set(self.token_list, on_error=lambda *error: errors.append(error))
+        self.assertEqual(errors, [])
+        self.assertEqual(len(tokens), 7)
+        self.assertIn(12345678, tokens)
+        self.assertIn(12345681, tokens)
+
+
+if __name__ == "__main__":
+    unittest.main()